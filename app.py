@@ -1,6 +1,5 @@
 # Launcher for refactored server
 import logging
-import asyncio
 import os
 import sys
 import argparse
@@ -35,14 +34,15 @@ logger = logging.getLogger(__name__)
 
 if __name__ == '__main__':
     try:
-        from server.main import main
+        from server.main import run
         logger.info("=" * 60)
         logger.info("Starting Minecraft Assessment Server")
         logger.info("=" * 60)
-        logger.info("📡 HTTP Server will run on: http://0.0.0.0:8080")
-        logger.info("🔌 WebSocket Server will run on: ws://0.0.0.0:8081")
+        # Same settings server.main binds to
+        logger.info(f"📡 HTTP Server will run on: http://0.0.0.0:{os.getenv('HTTP_PORT', '8080')}")
+        logger.info(f"🔌 WebSocket Server will run on: ws://0.0.0.0:{os.getenv('WS_PORT', '8081')}")
         logger.info("=" * 60)
-        asyncio.run(main())
+        run()
     except KeyboardInterrupt:
         logging.info('👋 Server stopped by user')
     except Exception as e:
@@ -1,5 +1,6 @@
 """AI client wrapper for Azure OpenAI calls."""
 import os
+import asyncio
 import logging
 import traceback
 logger = logging.getLogger(__name__)
@@ -17,6 +18,37 @@ client_type = None  # 'azure_sdk', 'azure_openai', 'openai_modern', 'legacy'
 init_attempted = False
 init_error = None
 
+# Cap simultaneous requests so batched analyses stay inside the deployment's rate limits
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '5'))
+# Created on first use from inside the running loop; before Python 3.10 asyncio primitives bind
+# to the loop current at construction, which at import time is not the one asyncio.run starts
+_request_semaphore = None
+
+
+def _get_request_semaphore():
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return _request_semaphore
+
+
+def _build_http_client():
+    """One pooled keep-alive transport for every AI call; HTTP/2 multiplexing when h2 is installed.
+    Returns None (SDK default transport) if httpx is unavailable.
+    """
+    try:
+        import httpx
+        from openai import DefaultAsyncHttpxClient
+    except ImportError:
+        return None
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    limits = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+    return DefaultAsyncHttpxClient(http2=http2, limits=limits)
+
 
 def init_client(force=False):
     """Attempt to initialize the AI client. This function is safe to call multiple times.
@@ -29,8 +61,9 @@ def init_client(force=False):
     init_error = None
     # Prefer the official Azure SDK when using default credentials — it accepts DefaultAzureCredential
     try:
-        from openai import OpenAI
-        from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+        # Async client and credential so requests never block the event loop
+        from openai import AsyncOpenAI
+        from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
         azure_endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
         use_default = os.getenv('AZURE_USE_DEFAULT_CREDENTIALS', 'false').lower() in ('1', 'true', 'yes')
         if use_default and azure_endpoint:
@@ -39,7 +72,7 @@ def init_client(force=False):
                 token_provider = get_bearer_token_provider(
                     DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
                 )
-                client = OpenAI(base_url=azure_endpoint, api_key=token_provider)
+                client = AsyncOpenAI(base_url=azure_endpoint, api_key=token_provider, http_client=_build_http_client())
                 logger.info('✅ Azure SDK OpenAIClient initialized with DefaultAzureCredential')
             except Exception as e:
                 logger.warning('Azure SDK OpenAIClient with DefaultAzureCredential failed: %s', e)
@@ -68,12 +101,13 @@ async def analyze_prompt(prompt, deployment=None, max_tokens=1000, temperature=0
         logger.debug('Prompt length: %d characters', len(prompt) if prompt else 0)
         logger.info('Using modern client object of type: %s', type(client))
         # Modern clients (AzureOpenAI or OpenAI) expose chat.completions.create
-        resp = client.chat.completions.create(
-            model=deployment,
-            messages=[{'role':'system','content':'You are a Minecraft gameplay assessment expert.'},{'role':'user','content':prompt}],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+        async with _get_request_semaphore():
+            resp = await client.chat.completions.create(
+                model=deployment,
+                messages=[{'role':'system','content':'You are a Minecraft gameplay assessment expert.'},{'role':'user','content':prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
         logger.debug('Raw response type: %s', type(resp))
         try:
             content = resp.choices[0].message.content
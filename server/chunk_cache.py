@@ -1,6 +1,4 @@
-import asyncio
 import zlib
-import pickle
 import numpy as np
 from typing import Dict, Optional, Tuple, Any
 from collections import OrderedDict
@@ -8,33 +6,103 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Chunks from ChunkProcessor are always 16x16x16 uint8, so the cache stores raw array bytes
+CHUNK_SHAPE = (16, 16, 16)
+# log2 of the deflate window for the zlib fallback; 2**12 bytes is one whole chunk
+ZLIB_WBITS = 12
+# Decoded chunks kept in front of the compressed cache (the ones players are standing in)
+L1_SIZE = 8
+
+# Faster codecs are optional; zstd (optionally with a trained dictionary) is preferred, then lz4, then zlib
+try:
+    import zstandard as zstd
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstd = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.block
+    LZ4_AVAILABLE = True
+except ImportError:
+    lz4 = None
+    LZ4_AVAILABLE = False
+
 
 class ChunkCache:
-    """High-performance LRU cache for chunk data with compression and persistent storage backing"""
+    """High-performance LRU cache for chunk data with compression and persistent storage backing.
+
+    Not thread-safe: use it from a single event loop. The cache bookkeeping never awaits, so
+    coroutines on that loop cannot interleave inside it and no lock is needed.
+    """
     
-    def __init__(self, max_size: int = 1000, compression_level: int = 6, storage=None):
+    def __init__(self, max_size: int = 1000, compression_level: int = 6, storage=None, dict_path: Optional[str] = None):
         self.max_size = max_size
-        self.compression_level = compression_level
+        self.compression_level = compression_level  # zlib fallback only
         self.storage = storage  # ChunkStorage instance
+        self._compress, self._decompress, self.codec = self._select_codec(dict_path)
         self.cache: OrderedDict[Tuple[int, int, int], bytes] = OrderedDict()
+        # Small LRU of read-only decoded arrays; every key in it is also in self.cache
+        self.l1: OrderedDict[Tuple[int, int, int], np.ndarray] = OrderedDict()
+        self.l1_max = L1_SIZE
         self.hit_count = 0
         self.miss_count = 0
-        self.lock = asyncio.Lock()
     
+    def _select_codec(self, dict_path: Optional[str]):
+        """Pick the fastest available codec; zstd uses a dictionary trained by train_dictionary() when given one."""
+        if ZSTD_AVAILABLE:
+            dict_data = None
+            if dict_path:
+                try:
+                    with open(dict_path, 'rb') as f:
+                        dict_data = zstd.ZstdCompressionDict(f.read())
+                except OSError as e:
+                    logger.warning(f"Could not load zstd dictionary {dict_path}: {e}")
+            compressor = zstd.ZstdCompressor(level=3, dict_data=dict_data)
+            decompressor = zstd.ZstdDecompressor(dict_data=dict_data)
+            return compressor.compress, decompressor.decompress, 'zstd+dict' if dict_data else 'zstd'
+        if LZ4_AVAILABLE:
+            return lz4.block.compress, lz4.block.decompress, 'lz4'
+        # Raw deflate with a 4 KiB window: a chunk is exactly 4 KiB, so the window still spans it, and
+        # there is no zlib header or adler32 to compute and check. zlib.compress only takes wbits from
+        # Python 3.11, so each call uses a fresh compressobj
+        level = self.compression_level
+
+        def compress(data: bytes) -> bytes:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -ZLIB_WBITS)
+            return compressor.compress(data) + compressor.flush()
+
+        return compress, (lambda data: zlib.decompress(data, wbits=-ZLIB_WBITS)), 'zlib'
+
+    @staticmethod
+    def train_dictionary(samples, dict_path: str, dict_size: int = 16384) -> None:
+        """Train a zstd dictionary from sample chunk payloads and write it to dict_path (offline helper)."""
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to train a dictionary")
+        trained = zstd.train_dictionary(dict_size, list(samples))
+        with open(dict_path, 'wb') as f:
+            f.write(trained.as_bytes())
+
     async def get(self, x: int, y: int, z: int) -> Optional[np.ndarray]:
         """Get chunk data from cache or storage"""
         key = (x, y, z)
-        async with self.lock:
-            if key in self.cache:
-                self.hit_count += 1
-                # Move to end (most recently used)
-                self.cache.move_to_end(key)
-                compressed_data = self.cache[key]
-                # Decompress
-                decompressed = zlib.decompress(compressed_data)
-                return pickle.loads(decompressed)
-            else:
-                self.miss_count += 1
+        arr = self.l1.get(key)
+        if arr is not None:
+            self.hit_count += 1
+            self.l1.move_to_end(key)
+            self.cache.move_to_end(key)
+            return arr
+        compressed_data = self.cache.get(key)
+        if compressed_data is not None:
+            # Hit path runs synchronously; only the storage miss path awaits
+            self.hit_count += 1
+            self.cache.move_to_end(key)
+            decompressed = self._decompress(compressed_data)
+            # Read-only view over the decompressed bytes; no copy and no pickle VM
+            arr = np.frombuffer(decompressed, dtype=np.uint8).reshape(CHUNK_SHAPE)
+            self._l1_insert(key, arr)
+            return arr
+        self.miss_count += 1
         
         # Try loading from storage if we have it
         if self.storage:
@@ -42,7 +110,7 @@ class ChunkCache:
             if data is not None:
                 # Add to cache
                 await self.put(x, y, z, data, save_to_storage=False)
-                return data
+                return self.l1[key]
         
         return None
     
@@ -54,42 +122,47 @@ class ChunkCache:
         if save_to_storage and self.storage:
             await self.storage.save(x, y, z, data)
         
-        async with self.lock:
-            # Compress data
-            serialized = pickle.dumps(data)
-            compressed = zlib.compress(serialized, level=self.compression_level)
-            
-            # Add to cache
-            self.cache[key] = compressed
-            self.cache.move_to_end(key)
-            
-            # Evict oldest if necessary (but data remains in storage)
-            if len(self.cache) > self.max_size:
-                evicted_key = self.cache.popitem(last=False)[0]
-                logger.debug(f"Evicted chunk {evicted_key} from cache (still in storage)")
+        # Compress data
+        serialized = np.ascontiguousarray(data, dtype=np.uint8).tobytes()
+        compressed = self._compress(serialized)
+        
+        # Add to cache
+        self.cache[key] = compressed
+        self.cache.move_to_end(key)
+        self._l1_insert(key, np.frombuffer(serialized, dtype=np.uint8).reshape(CHUNK_SHAPE))
+        
+        # Evict oldest if necessary (but data remains in storage)
+        if len(self.cache) > self.max_size:
+            evicted_key = self.cache.popitem(last=False)[0]
+            self.l1.pop(evicted_key, None)
+            logger.debug(f"Evicted chunk {evicted_key} from cache (still in storage)")
+    
+    def _l1_insert(self, key: Tuple[int, int, int], arr: np.ndarray) -> None:
+        self.l1[key] = arr
+        self.l1.move_to_end(key)
+        if len(self.l1) > self.l1_max:
+            self.l1.popitem(last=False)
     
     async def prefetch(self, center_x: int, center_y: int, center_z: int, radius: int = 2) -> None:
         """Pre-fetch chunks around a center position from storage"""
         if not self.storage:
             return
             
-        tasks = []
-        for dx in range(-radius, radius + 1):
-            for dy in range(-radius, radius + 1):
-                for dz in range(-radius, radius + 1):
-                    x, y, z = center_x + dx, center_y + dy, center_z + dz
-                    if not await self.exists_in_cache(x, y, z):
-                        # Load from storage if it exists there
-                        if await self.storage.exists(x, y, z):
-                            tasks.append(self.get(x, y, z))
+        offsets = np.arange(-radius, radius + 1)
+        coords = np.stack(np.meshgrid(offsets, offsets, offsets, indexing='ij'), -1).reshape(-1, 3)
+        coords += np.array([center_x, center_y, center_z])
+        wanted = set(map(tuple, coords.tolist())) - self.cache.keys()
+        if not wanted:
+            return
         
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+        # One membership pass and one batched read for the whole neighbourhood
+        on_disk = await self.storage.exists_many(wanted)
+        for (x, y, z), data in (await self.storage.load_many(on_disk)).items():
+            await self.put(x, y, z, data, save_to_storage=False)
     
     async def exists_in_cache(self, x: int, y: int, z: int) -> bool:
         """Check if chunk exists in cache"""
-        async with self.lock:
-            return (x, y, z) in self.cache
+        return (x, y, z) in self.cache
     
     async def exists(self, x: int, y: int, z: int) -> bool:
         """Check if chunk exists in cache or storage"""
@@ -106,9 +179,11 @@ class ChunkCache:
         
         return {
             "size": len(self.cache),
+            "l1_size": len(self.l1),
             "max_size": self.max_size,
             "hit_count": self.hit_count,
             "miss_count": self.miss_count,
             "hit_rate": hit_rate,
+            "codec": self.codec,
             "memory_usage_mb": sum(len(v) for v in self.cache.values()) / (1024 * 1024)
         }
@@ -1,15 +1,19 @@
 import asyncio
+import functools
 import numpy as np
-from typing import List, Dict, Tuple, Optional, Any, Set
-from collections import defaultdict
+from typing import List, Dict, Deque, Tuple, Optional, Any, Set
+from collections import deque, OrderedDict
 import time
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import threading
 import os
+import mmap
 import psutil
-import json
-import pickle
-import gzip
+import orjson
+import struct
+import zlib
 from pathlib import Path
 
 # Set up logger first
@@ -18,18 +22,496 @@ logger = logging.getLogger(__name__)
 # Try to import GPU acceleration libraries
 try:
     import cupy as cp
+    import cupyx
     GPU_AVAILABLE = True
     logger.info("GPU acceleration available via CuPy")
+    # A whole batch in one launch: each block derives its world position from its chunk's origin,
+    # computes its column height (all octaves plus biome, in double like the CPU path), then picks
+    # bedrock / stone / dirt / grass / air and places ores and caves inside stone. Recomputing the
+    # height per block costs a few trig calls but saves a launch per octave and the height map round
+    # trip. The ore roll comes from a stateless hash of world position, so there is no cuRAND launch
+    # or scratch array and a chunk regenerates identically. As on the CPU, the roll is split into the
+    # disjoint _ore_bands; the *_edge arguments are their upper edges, in _ORES order
+    _chunk_blocks_kernel = cp.ElementwiseKernel(
+        'raw int32 origins, int32 size, int32 octaves, float64 biome_scale, float32 coal_edge, '
+        'float32 iron_edge, float32 gold_edge, float32 diamond_edge, float32 redstone_edge, float32 lapis_edge',
+        'uint8 block',
+        '''
+        int per_chunk = size * size * size;
+        int n = i / per_chunk, local = i % per_chunk;
+        int x = origins[3 * n] + local / (size * size);
+        int y = origins[3 * n + 1] + (local / size) % size;
+        int z = origins[3 * n + 2] + local % size;
+        double height = 64.0, amplitude = 64.0, frequency = 0.01;
+        for (int octave = 0; octave < octaves; ++octave) {
+            height += sin(x * frequency) * amplitude + cos(z * frequency) * amplitude
+                    + sin((x + z) * frequency * 0.5) * amplitude * 0.5;
+            amplitude *= 0.5;
+            frequency *= 2.0;
+        }
+        height += sin(x * biome_scale) * cos(z * biome_scale) * 16.0;
+        float h = (float)height;
+        unsigned char b = (y >= h + 1) ? (y < 1 ? 7 : 0) : (y >= h) ? 3 : (y >= h - 5) ? 2 : (y < 1 ? 7 : 1);
+        if (y >= 1 && y < h - 5) {
+            float roll = ore_noise(x, y, z, 1u);
+            if (roll < coal_edge) { if (y > 5 && y < 100) b = 16; }
+            else if (roll < iron_edge) { if (y > 5 && y < 64) b = 15; }
+            else if (roll < gold_edge) { if (y > 5 && y < 32) b = 14; }
+            else if (roll < diamond_edge) { if (y > 1 && y < 16) b = 56; }
+            else if (roll < redstone_edge) { if (y > 1 && y < 16) b = 73; }
+            else if (roll < lapis_edge) { if (y > 10 && y < 40) b = 21; }
+            if (y > 5) {
+                float fx = (float)x, fy = (float)y, fz = (float)z;
+                float cave1 = sinf(fx * 0.1f) * cosf(fy * 0.1f) * sinf(fz * 0.1f);
+                float cave2 = cosf(fx * 0.08f) * sinf(fy * 0.08f) * cosf(fz * 0.08f);
+                if (fabsf(cave1 + cave2) < 0.1f) b = 0;
+            }
+        }
+        block = b;
+        ''',
+        'chunk_blocks',
+        preamble='''
+        __device__ float ore_noise(int x, int y, int z, unsigned int salt) {
+            unsigned int h = (unsigned int)x * 374761393u + (unsigned int)y * 668265263u
+                           + (unsigned int)z * 2246822519u + salt * 2654435761u;
+            h = (h ^ (h >> 13)) * 1274126177u;
+            h ^= h >> 16;
+            return (h >> 8) * (1.0f / 16777216.0f);
+        }
+        ''')
+
 except ImportError:
     cp = None
     GPU_AVAILABLE = False
     logger.info("GPU acceleration not available, using CPU")
 
+# Numba is optional; when present a whole CPU batch is generated by one parallel JIT kernel
+try:
+    import math
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = prange = None
+    NUMBA_AVAILABLE = False
+
+# zstd is optional for swapped-out chunk files; raw deflate is the fallback
+try:
+    import zstandard as zstd
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstd = None
+    ZSTD_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _generate_chunks_nb(xs, ys, zs, out, biome_means, octaves, biome_scale,
+                            ore_bands, ore_ids, ore_min_y, ore_max_y):
+        """Same terrain rules as _generate_optimized_chunk_cpu, one x-slab of one chunk per prange
+        iteration so even a single-chunk batch spreads across cores."""
+        size = out.shape[1]
+        biome_rows = np.empty(xs.shape[0] * size)
+        # Cave noise is separable; the y factors are shared by every column of a chunk, so they are
+        # computed once per chunk here rather than allocated in each row
+        cave_y1 = np.empty((xs.shape[0], size))
+        cave_y2 = np.empty((xs.shape[0], size))
+        for n in prange(xs.shape[0]):
+            for j in range(size):
+                wy = ys[n] * size + j
+                cave_y1[n, j] = math.cos(wy * 0.1)
+                cave_y2[n, j] = math.sin(wy * 0.08)
+        for row in prange(xs.shape[0] * size):
+            n = row // size
+            i = row % size
+            biome_sum = 0.0
+            wx = xs[n] * size + i
+            cave_x1 = math.sin(wx * 0.1)
+            cave_x2 = math.cos(wx * 0.08)
+            for k in range(size):
+                wz = zs[n] * size + k
+                cave_xz1 = cave_x1 * math.sin(wz * 0.1)
+                cave_xz2 = cave_x2 * math.cos(wz * 0.08)
+                height = 0.0
+                amplitude = 64.0
+                frequency = 0.01
+                for _ in range(octaves):
+                    height += (math.sin(wx * frequency) * amplitude +
+                               math.cos(wz * frequency) * amplitude +
+                               math.sin((wx + wz) * frequency * 0.5) * amplitude * 0.5)
+                    amplitude *= 0.5
+                    frequency *= 2.0
+                biome = math.sin(wx * biome_scale) * math.cos(wz * biome_scale)
+                biome_sum += biome
+                height += 64 + biome * 16
+                for j in range(size):
+                    wy = ys[n] * size + j
+                    block = 7 if wy < 1 else 0
+                    stone = wy >= 1 and wy < height - 5
+                    if stone:
+                        block = 1
+                        # One roll split into the disjoint per-ore bands, as in _generate_chunk_into
+                        roll = np.random.random()
+                        if roll < ore_bands[-1]:
+                            ore = 0
+                            while roll >= ore_bands[ore]:
+                                ore += 1
+                            if wy > ore_min_y[ore] and wy < ore_max_y[ore]:
+                                block = ore_ids[ore]
+                    elif wy >= height - 5:
+                        # Dirt and grass override bedrock, matching _TERRAIN_LUT
+                        if wy < height:
+                            block = 2
+                        elif wy < height + 1:
+                            block = 3
+                    if wy > 5 and wy < height - 5 and abs(cave_xz1 * cave_y1[n, j] + cave_xz2 * cave_y2[n, j]) < 0.1:
+                        block = 0
+                    out[n, i, j, k] = block
+            biome_rows[row] = biome_sum
+        for n in range(xs.shape[0]):
+            biome_means[n] = biome_rows[n * size:(n + 1) * size].sum() / (size * size)
+
+
+# Swapped-out chunks hold the raw block bytes, compressed with the best codec available; chunks
+# written with the other codec stay readable. Per-chunk files from before region files use the suffix.
+_CHUNK_SUFFIXES = ('.zst', '.deflate') if ZSTD_AVAILABLE else ('.deflate',)
+# Raw deflate window for deflate-compressed chunks; 2**12 bytes is one whole 16^3 chunk
+_DEFLATE_WBITS = 12
+
+# Region files (r.X.Y.Z.bin) group the 32x32 chunk columns at one chunk y level: a header of 1024
+# (offset, length) uint32 pairs, then appended records
+_REGION_SHIFT = 5
+_REGION_SLOTS = 1 << (2 * _REGION_SHIFT)
+_REGION_HEADER_BYTES = _REGION_SLOTS * 8
+# Record: codec (index into _RECORD_CODECS), metadata JSON length, the JSON, then the compressed chunk
+_RECORD_HEAD = struct.Struct('<BI')
+_RECORD_CODECS = ('.deflate', '.zst')
+
+
+def _encode_chunk_file(chunk: np.ndarray) -> bytes:
+    data = np.ascontiguousarray(chunk, dtype=np.uint8).tobytes()
+    if ZSTD_AVAILABLE:
+        # Compressor objects are not thread-safe, and a fresh one for 4 KiB of input is cheap
+        return zstd.ZstdCompressor(level=3).compress(data)
+    # zlib.compress only takes wbits from Python 3.11
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -_DEFLATE_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decode_chunk_file(suffix: str, blob: bytes) -> bytes:
+    if suffix == '.zst':
+        return zstd.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob, wbits=-_DEFLATE_WBITS)
+
+
+def _region_slot(key: Tuple[int, int, int]) -> Tuple[Tuple[int, int, int], int]:
+    """Region file key and header slot of a chunk"""
+    x, y, z = key
+    mask = (1 << _REGION_SHIFT) - 1
+    return (x >> _REGION_SHIFT, y, z >> _REGION_SHIFT), ((x & mask) << _REGION_SHIFT) | (z & mask)
+
+
+class RegionFile:
+    """One region file with its header kept in memory. Records are only ever appended, and a slot is
+    pointed at its record after the record is written, so reads need no lock against writers."""
+    __slots__ = ('path', 'key', 'header', 'lock', '_map')
+
+    # Each mapping holds a file descriptor, so only the most recently mapped regions stay mapped
+    MAX_MAPPED = 256
+    _mapped: "OrderedDict[RegionFile, None]" = OrderedDict()
+    _mapped_lock = threading.Lock()
+
+    def __init__(self, path: Path, key: Tuple[int, int, int]):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        head = b''
+        if path.exists():
+            with open(path, 'rb') as f:
+                head = f.read(_REGION_HEADER_BYTES)
+        if len(head) < _REGION_HEADER_BYTES:
+            head = bytes(_REGION_HEADER_BYTES)
+        self.header = np.frombuffer(head, dtype='<u4').reshape(_REGION_SLOTS, 2).copy()
+
+    def chunk_keys(self) -> List[Tuple[int, int, int]]:
+        region_x, y, region_z = self.key
+        slots = np.flatnonzero(self.header[:, 1])
+        return [((region_x << _REGION_SHIFT) | int(slot >> _REGION_SHIFT), y,
+                 (region_z << _REGION_SHIFT) | int(slot) & ((1 << _REGION_SHIFT) - 1)) for slot in slots]
+
+    def read(self, slot: int) -> Optional[memoryview]:
+        """The slot's record as a view into the page cache, or None if the slot is empty"""
+        offset, length = (int(v) for v in self.header[slot])
+        if not length:
+            return None
+        view = self._map
+        if view is None or offset + length > len(view):
+            # First read, or the record was appended after the file was mapped
+            with self.lock:
+                view = self._map
+                if view is None or offset + length > len(view):
+                    with open(self.path, 'rb') as f:
+                        view = self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with RegionFile._mapped_lock:
+                RegionFile._mapped[self] = None
+                RegionFile._mapped.move_to_end(self)
+                while len(RegionFile._mapped) > RegionFile.MAX_MAPPED:
+                    # Not closed: a reader may still hold a view; it is unmapped once released
+                    RegionFile._mapped.popitem(last=False)[0]._map = None
+        return memoryview(view)[offset:offset + length]
+
+    def append(self, records: List[Tuple[int, bytes]]):
+        """Write records at the end of the file in one write, then rewrite the header once"""
+        with self.lock:
+            mode = 'r+b' if self.path.exists() else 'w+b'
+            with open(self.path, mode) as f:
+                end = max(f.seek(0, os.SEEK_END), _REGION_HEADER_BYTES)
+                f.seek(end)
+                f.write(b''.join(blob for _, blob in records))
+                header = self.header.copy()
+                for slot, blob in records:
+                    header[slot] = (end, len(blob))
+                    end += len(blob)
+                f.seek(0)
+                f.write(header.tobytes())
+            self.header = header
+
+
+class PackedChunk:
+    """A chunk as its palette of distinct block ids plus palette indices packed at 0, 1, 2, 4 or 8
+    bits per block. Generated chunks use only a handful of ids, so most take a half or a quarter of
+    the dense 4 KiB, and uniform (all-air or all-stone) chunks store no indices at all. Palette and
+    indices share one bytes object, so a cached chunk costs two small Python objects, not three
+    plus two ndarray headers."""
+    __slots__ = ('size', 'bits', 'blob')
+
+    def __init__(self, chunk: np.ndarray):
+        flat = chunk.reshape(-1)
+        present = np.bincount(flat, minlength=256)
+        palette = np.flatnonzero(present).astype(np.uint8)
+        self.size = chunk.shape[0]
+        self.bits = next(b for b in (0, 1, 2, 4, 8) if len(palette) <= 1 << b)
+        if self.bits == 0:
+            data = b''
+        elif self.bits == 8:
+            data = flat.tobytes()
+        else:
+            lut = np.zeros(256, dtype=np.uint8)
+            lut[palette] = np.arange(len(palette), dtype=np.uint8)
+            per_byte = 8 // self.bits
+            indices = lut[flat].reshape(-1, per_byte)
+            packed = indices[:, 0].copy()
+            for i in range(1, per_byte):
+                packed |= indices[:, i] << (i * self.bits)
+            data = packed.tobytes()
+        self.blob = palette.tobytes() + data
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.blob)
+
+    def unpack(self) -> np.ndarray:
+        """Dense read-only uint8 array of the chunk"""
+        shape = (self.size,) * 3
+        raw = np.frombuffer(self.blob, dtype=np.uint8)
+        palette_len = len(raw) - self.size ** 3 * self.bits // 8
+        palette, data = raw[:palette_len], raw[palette_len:]
+        if self.bits == 0:
+            chunk = np.full(shape, palette[0], dtype=np.uint8)
+        elif self.bits == 8:
+            chunk = data.reshape(shape)
+        else:
+            per_byte = 8 // self.bits
+            mask = (1 << self.bits) - 1
+            indices = np.empty((data.size, per_byte), dtype=np.uint8)
+            for i in range(per_byte):
+                np.bitwise_and(data >> (i * self.bits), mask, out=indices[:, i])
+            chunk = palette[indices].reshape(shape)
+        chunk.setflags(write=False)
+        return chunk
+
+
+# Cave noise constants as float32 so the 16^3 noise arrays stay float32 instead of upcasting to float64
+_F32_0_1 = np.float32(0.1)
+_F32_0_08 = np.float32(0.08)
+
+# (resource_density key, block id, exclusive min/max world y) for each ore. Every backend rolls once
+# per stone block and splits [0, 1) into disjoint bands in this order (_ore_bands); the GPU kernel
+# spells the same table out in CUDA, so keep the two in step
+_ORES = (('coal', 16, 5, 100), ('iron', 15, 5, 64), ('gold', 14, 5, 32),
+         ('diamond', 56, 1, 16), ('redstone', 73, 1, 16), ('lapis', 21, 10, 40))
+
+# The same as arrays indexed by position in _ORES
+_ORE_IDS = np.array([block_id for _, block_id, _, _ in _ORES], dtype=np.uint8)
+_ORE_MIN_Y = np.array([min_y for _, _, min_y, _ in _ORES], dtype=np.int64)
+_ORE_MAX_Y = np.array([max_y for _, _, _, max_y in _ORES], dtype=np.int64)
+
+
+@functools.lru_cache(maxsize=16)
+def _ore_bands(densities: Tuple[float, ...]) -> np.ndarray:
+    """Upper edge of each ore's slice of [0, 1), in _ORES order"""
+    bands = np.cumsum(densities, dtype=np.float32)
+    bands.setflags(write=False)
+    return bands
+
+_thread_local = threading.local()
+
+
+def _thread_scratch(shape: Tuple[int, ...]) -> Dict[str, np.ndarray]:
+    """Per-thread chunk-sized work buffers for _generate_chunk_into, reused across chunks"""
+    scratch = getattr(_thread_local, 'scratch', None)
+    if scratch is None or scratch['layer'].shape != shape:
+        scratch = _thread_local.scratch = {
+            'layer': np.empty(shape, dtype=np.uint8),
+            'mask': np.empty(shape, dtype=bool),
+            'other_mask': np.empty(shape, dtype=bool),
+            'stone_mask': np.empty(shape, dtype=bool),
+            'roll': np.empty(shape, dtype=np.float32),
+            'noise1': np.empty(shape, dtype=np.float32),
+            'noise2': np.empty(shape, dtype=np.float32),
+        }
+    return scratch
+
+
+def _thread_rng() -> np.random.Generator:
+    """Per-thread ore RNG; Generator instances are not safe to share between executor threads"""
+    rng = getattr(_thread_local, 'rng', None)
+    if rng is None:
+        rng = _thread_local.rng = np.random.Generator(np.random.SFC64())
+    return rng
+
+# Block id by [is bedrock row][terrain layer]; see _generate_chunk_into
+_TERRAIN_LUT = np.array([[1, 2, 3, 0],
+                         [7, 2, 3, 7]], dtype=np.uint8)
+_TERRAIN_LUT_FLAT = _TERRAIN_LUT.reshape(-1)
+
+
+@functools.lru_cache(maxsize=None)
+def _chunk_offsets(chunk_size: int) -> np.ndarray:
+    """Read-only 0..chunk_size-1 axis, broadcast into world coordinates by every chunk"""
+    offsets = np.arange(chunk_size, dtype=np.int32)
+    offsets.setflags(write=False)
+    return offsets
+
+
+@functools.lru_cache(maxsize=None)
+def _octave_table(detail_octaves: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Frequency and amplitude of each height octave: 0.01 and 64, doubling and halving per octave"""
+    frequencies = 0.01 * 2.0 ** np.arange(detail_octaves)
+    amplitudes = 64.0 * 0.5 ** np.arange(detail_octaves)
+    frequencies.setflags(write=False)
+    amplitudes.setflags(write=False)
+    return frequencies, amplitudes
+
+
+@functools.lru_cache(maxsize=4096)
+def _column_terrain(x: int, z: int, chunk_size: int, detail_octaves: int,
+                    biome_scale: float) -> Tuple[np.ndarray, float]:
+    """Height map (chunk_size, 1, chunk_size) and mean biome noise for the chunk column at (x, z)"""
+    offsets = _chunk_offsets(chunk_size)
+    world_x = (x * chunk_size + offsets)[:, None, None]
+    world_z = (z * chunk_size + offsets)[None, None, :]
+    
+    # Multi-octave noise for realistic terrain, every octave at once along a trailing axis
+    frequencies, amplitudes = _octave_table(detail_octaves)
+    height_map = (
+        np.sin(world_x[..., None] * frequencies) @ amplitudes +
+        np.cos(world_z[..., None] * frequencies) @ amplitudes +
+        np.sin((world_x + world_z)[..., None] * (frequencies * 0.5)) @ (amplitudes * 0.5)
+    ).astype(np.float32)
+    
+    height_map += 64  # Base height
+    
+    # Biome variation
+    biome_noise = np.sin(world_x * biome_scale) * np.cos(world_z * biome_scale)
+    height_map += biome_noise * 16
+    # Shared between calls through the cache, so it must never be written to
+    height_map.setflags(write=False)
+    return height_map, float(biome_noise.mean())
+
+
+def _generate_chunk_into(chunk: np.ndarray, x: int, y: int, z: int, detail_octaves: int,
+                         biome_scale: float, resource_density: Dict[str, float]) -> Dict[str, Any]:
+    """Fill `chunk` with the terrain for chunk (x, y, z) and return its metadata"""
+    chunk_size = chunk.shape[0]
+    
+    # World coordinates as broadcastable int32 axes (x, y, z) instead of full 3D meshgrids, plus
+    # float32 copies so comparisons against the float32 height map don't promote to float64
+    offsets = _chunk_offsets(chunk_size)
+    world_x = (x * chunk_size + offsets)[:, None, None]
+    world_y = (y * chunk_size + offsets)[None, :, None]
+    world_z = (z * chunk_size + offsets)[None, None, :]
+    fx, fy, fz = (coord.astype(np.float32) for coord in (world_x, world_y, world_z))
+    
+    # Terrain height only depends on x/z, so every chunk in a column shares one cached height map
+    height_map, biome_mean = _column_terrain(x, z, chunk_size, detail_octaves, biome_scale)
+    stone_top = height_map - 5
+    
+    # Per-thread scratch; every full-size intermediate below is written into one of these with out=
+    scratch = _thread_scratch(chunk.shape)
+    layer, mask, other_mask = scratch['layer'], scratch['mask'], scratch['other_mask']
+    
+    # Terrain layers in one pass: layer 0 = stone (below height-5), 1 = dirt, 2 = grass, 3 = air,
+    # 4-7 the same on the bedrock row; dirt and grass take precedence over bedrock
+    np.greater_equal(fy, stone_top, out=mask)
+    np.copyto(layer, mask)
+    layer += np.greater_equal(fy, height_map, out=mask)
+    layer += np.greater_equal(fy, height_map + 1, out=mask)
+    layer += (world_y < 1).astype(np.uint8) * 4
+    np.take(_TERRAIN_LUT_FLAT, layer, out=chunk)
+    stone_mask = np.equal(layer, 0, out=scratch['stone_mask'])
+    
+    # Generate ores with realistic distribution: one float32 draw per block, split into disjoint bands
+    # of [0, 1) per ore so each ore still lands with its own density. Only the few stone blocks whose
+    # roll falls in any band (about 1 in 8) go on to the per-ore lookup and y range check
+    if stone_mask.any():
+        bands = _ore_bands(tuple(resource_density[ore] for ore, *_ in _ORES))
+        roll = _thread_rng().random(dtype=np.float32, out=scratch['roll'])
+        np.less(roll, bands[-1], out=mask)
+        mask &= stone_mask
+        candidates = np.flatnonzero(mask)
+        ore = np.searchsorted(bands, roll.reshape(-1)[candidates], side='right')
+        block_y = y * chunk_size + (candidates // chunk_size) % chunk_size
+        hit = (block_y > _ORE_MIN_Y[ore]) & (block_y < _ORE_MAX_Y[ore])
+        chunk.reshape(-1)[candidates[hit]] = _ORE_IDS[ore[hit]]
+    
+    # Add caves (3D noise for realistic cave systems); each term is separable, so the trig runs on
+    # the axes and only the products are full size
+    cave_noise1, cave_noise2 = scratch['noise1'], scratch['noise2']
+    np.multiply(np.sin(fx * _F32_0_1) * np.cos(fy * _F32_0_1), np.sin(fz * _F32_0_1), out=cave_noise1)
+    np.multiply(np.cos(fx * _F32_0_08) * np.sin(fy * _F32_0_08), np.cos(fz * _F32_0_08), out=cave_noise2)
+    cave_noise1 += cave_noise2
+    np.less(np.abs(cave_noise1, out=cave_noise1), _F32_0_1, out=mask)
+    mask &= world_y > 5
+    mask &= np.less(fy, stone_top, out=other_mask)
+    np.putmask(chunk, mask, 0)  # Air in caves
+    
+    return {
+        'generated_at': time.time(),
+        'biome': 'plains' if biome_mean > 0 else 'desert',
+        'has_ores': bool(np.greater(chunk, 10, out=mask).any())
+    }
+
+
+def _generate_batch_cpu(coords: List[Tuple[int, int, int]], chunk_size: int, detail_octaves: int,
+                        biome_scale: float, resource_density: Dict[str, float]) -> Tuple[bytes, List[Dict[str, Any]]]:
+    """Process-pool entry point: generate a batch and return it as one raw byte blob plus per-chunk metadata"""
+    batch_buf = np.empty((len(coords), chunk_size, chunk_size, chunk_size), dtype=np.uint8)
+    metadata = [_generate_chunk_into(batch_buf[idx], x, y, z, detail_octaves, biome_scale, resource_density)
+                for idx, (x, y, z) in enumerate(coords)]
+    return batch_buf.tobytes(), metadata
+
+
+def _seed_worker_rng():
+    # Forked workers inherit the parent's RNG state; reseed so their ore placement differs
+    np.random.seed()
+    _thread_local.rng = None
+
 
 class ChunkProcessor:
     """Async chunk processor with GPU acceleration and optimized memory usage"""
     
-    def __init__(self, batch_size: int = 50, max_workers: int = None, world_name: str = "default"):
+    def __init__(self, batch_size: int = 50, max_workers: int = None, world_name: str = "default",
+                 max_batch_wait_ms: float = 5.0):
         # GPU availability for this instance
         self.gpu_available = GPU_AVAILABLE
         
@@ -41,10 +523,34 @@ class ChunkProcessor:
             max_workers = min(32, (os.cpu_count() or 1) * 2)
         
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.pending_requests: Dict[Tuple[int, int, int], List[asyncio.Future]] = defaultdict(list)
+        # NumPy terrain generation holds the GIL, so CPU batches run in worker processes. The GPU path
+        # and the Numba kernel (which releases the GIL) stay on the thread pool.
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        if not self.gpu_available and not NUMBA_AVAILABLE:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                    mp_context=multiprocessing.get_context(method),
+                                                    initializer=_seed_worker_rng)
+        self.pending_requests: Dict[Tuple[int, int, int], List[asyncio.Future]] = {}
+        # Coords of pending_requests in arrival order, so a batch is popped in O(batch_size)
+        self._pending_order: Deque[Tuple[int, int, int]] = deque()
+        self._pending_count = 0  # futures across pending_requests, kept in step by process_chunk/_create_batch
+        # One shared future per chunk from the moment it is requested until its result is delivered
+        self.in_flight: Dict[Tuple[int, int, int], asyncio.Future] = {}
         self.processing_lock = asyncio.Lock()
         self.batch_queue: asyncio.Queue = asyncio.Queue()
         self.processing_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # set by start(); used per batch
+        # Longest a request waits for its batch to fill: a partial batch is flushed this long after its
+        # oldest request arrived, however steadily new requests keep trickling in
+        self.batch_timeout = max_batch_wait_ms / 1000
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Batches computing at once; with 2, delivery of one batch overlaps generation of the next
+        self.pipeline_depth = 2
+        # The pinned staging buffer and the Numba kernel are shared by overlapping batches
+        self._gpu_copy_lock = threading.Lock()
+        self._numba_lock = threading.Lock()
         
         # Memory management - optimize for massive worlds
         self.memory_info = psutil.virtual_memory()
@@ -52,7 +558,9 @@ class ChunkProcessor:
         self.chunk_size = 16
         
         # Persistent chunk storage for detailed maps
-        self.chunk_cache: Dict[Tuple[int, int, int], np.ndarray] = {}
+        # Kept in LRU order (oldest first) and palette-packed; callers get a fresh dense copy per hit
+        self.chunk_cache: "OrderedDict[Tuple[int, int, int], PackedChunk]" = OrderedDict()
+        self._cache_bytes = 0
         self.chunk_metadata: Dict[Tuple[int, int, int], Dict[str, Any]] = {}
         
         # Disk persistence for unlimited world size
@@ -60,11 +568,28 @@ class ChunkProcessor:
         self.world_path = Path(f"worlds/{world_name}")
         self.world_path.mkdir(parents=True, exist_ok=True)
         self.chunks_on_disk: Set[Tuple[int, int, int]] = set()
+        # Chunks handed to _write_behind whose files are not on disk yet
+        self._unwritten: Dict[Tuple[int, int, int], PackedChunk] = {}
+        self._write_jobs: Set[asyncio.Future] = set()
+        # Cached chunks with no file yet; _swap_worker persists them ahead of time so eviction of a
+        # clean chunk is just a pop
+        self._dirty: Set[Tuple[int, int, int]] = set()
+        self._swap_queue: asyncio.Queue = asyncio.Queue()
+        self._swap_task: Optional[asyncio.Task] = None
+        self._swap_batch_size = 256
+        # Set by stop(): once the swap worker is gone, failed writes wait in _unsaved for stop() to retry
+        self._stopping = False
+        self._unsaved: Dict[Tuple[int, int, int], PackedChunk] = {}
+        self._stop_write_attempts = 3
+        # Region files by region key; their headers double as the index of chunks on disk
+        self._regions: Dict[Tuple[int, int, int], RegionFile] = {}
+        self._regions_lock = threading.Lock()
         self._load_world_index()
         
         # Memory management with disk swapping
         self.max_memory_chunks = int((self.memory_info.total * self.max_memory_percent) / (self.chunk_size ** 3 * 4))
-        self.chunk_access_time: Dict[Tuple[int, int, int], float] = {}
+        # Packed chunks vary in size, so the cache is bounded by bytes; same budget as max_memory_chunks dense
+        self.max_memory_bytes = self.max_memory_chunks * self.chunk_size ** 3
         
         # Enhanced terrain generation parameters
         self.biome_scale = 0.001  # Large scale biomes
@@ -80,6 +605,17 @@ class ChunkProcessor:
         }
         
         # GPU memory management
+        self._copy_stream = None  # non-blocking stream for device-to-host copies
+        self._host_buf: Optional[np.ndarray] = None  # pinned staging buffer, grown to the largest batch
+        self._mempool_soft_cap = 2 * 1024**3  # pooled bytes kept between batches; set_limit is the hard cap
+        
+        # GPU batch size autotuning: grow while per-chunk time keeps falling, back off once it rises
+        self.max_batch_size = self.batch_size  # raised from free device memory in _setup_gpu
+        self._pregen_batch_size = 2048  # pregenerate_area hands the generator this many chunks at a time
+        self._ms_per_chunk: Optional[float] = None  # EMA over full batches
+        self._tuned_ms_per_chunk: Optional[float] = None  # EMA at the previous tuning step
+        self._batches_since_tune = 0
+        self._tune_interval = 16
         if self.gpu_available:
             self._setup_gpu()
 
@@ -108,6 +644,14 @@ class ChunkProcessor:
                     logger.debug("deviceSetCacheConfig not supported in this CuPy runtime")
             except Exception as e:
                 logger.debug(f"Runtime cache config access failed: {e}")
+            # Pinned host memory roughly doubles device-to-host bandwidth over pageable memory
+            try:
+                self._pinned_pool = cp.cuda.PinnedMemoryPool()
+                cp.cuda.set_pinned_memory_allocator(self._pinned_pool.malloc)
+                self._copy_stream = cp.cuda.Stream(non_blocking=True)
+            except Exception as e:
+                logger.debug(f"Pinned memory / copy stream unavailable, using pageable copies: {e}")
+                self._copy_stream = None
             # Device info (best-effort)
             try:
                 rt = cp.cuda.runtime
@@ -115,6 +659,8 @@ class ChunkProcessor:
                 if hasattr(rt, "memGetInfo"):
                     free_b, total_b = rt.memGetInfo()
                     logger.info(f"GPU device {device_id}, memory {total_b / 1024**3:.2f} GB")
+                    # ~32 bytes of float32/bool temporaries per block, with 2x headroom
+                    self.max_batch_size = max(self.batch_size, int(free_b // (self.chunk_size ** 3 * 32 * 2)))
             except Exception as e:
                 logger.debug(f"Skipping GPU info query: {e}")
         except Exception as e:
@@ -123,136 +669,325 @@ class ChunkProcessor:
             self.gpu_available = False
 
     def _load_world_index(self):
-        """Load the index of chunks stored on disk"""
+        """Find the chunks stored on disk: every filled slot of every region file, plus the chunks listed
+        in the index of per-chunk files that older versions wrote"""
         index_file = self.world_path / "chunk_index.json"
         if index_file.exists():
-            with open(index_file, 'r') as f:
-                data = json.load(f)
-                self.chunks_on_disk = set(tuple(coord) for coord in data['chunks'])
-                logger.info(f"Loaded world with {len(self.chunks_on_disk)} chunks on disk")
+            data = orjson.loads(index_file.read_bytes())
+            self.chunks_on_disk = set(map(tuple, data['chunks']))
+        for path in self.world_path.glob('r.*.bin'):
+            try:
+                region_key = tuple(int(part) for part in path.name.split('.')[1:4])
+                region = self._regions[region_key] = RegionFile(path, region_key)
+                self.chunks_on_disk.update(region.chunk_keys())
+            except (ValueError, OSError) as e:
+                logger.error(f"Skipping unreadable region file {path.name}: {e}")
+        if self.chunks_on_disk:
+            logger.info(f"Loaded world with {len(self.chunks_on_disk)} chunks on disk")
 
-    def _save_world_index(self):
-        """Save the index of chunks stored on disk"""
-        index_file = self.world_path / "chunk_index.json"
-        with open(index_file, 'w') as f:
-            json.dump({
-                'chunks': list(self.chunks_on_disk),
-                'world_name': self.world_name,
-                'chunk_size': self.chunk_size
-            }, f)
-
-    def _save_chunk_to_disk(self, key: Tuple[int, int, int], chunk: np.ndarray):
-        """Save chunk to disk with compression"""
-        x, y, z = key
-        chunk_file = self.world_path / f"chunk_{x}_{y}_{z}.npz"
-        with gzip.open(chunk_file, 'wb') as f:
-            np.savez_compressed(f, chunk=chunk, metadata=self.chunk_metadata.get(key, {}))
-        self.chunks_on_disk.add(key)
+    def _region(self, region_key: Tuple[int, int, int]) -> RegionFile:
+        region = self._regions.get(region_key)
+        if region is None:
+            with self._regions_lock:
+                region = self._regions.get(region_key)
+                if region is None:
+                    path = self.world_path / "r.{}.{}.{}.bin".format(*region_key)
+                    region = self._regions[region_key] = RegionFile(path, region_key)
+        return region
+
+    def _save_chunks_to_disk(self, items: List[Tuple[Tuple[int, int, int], Any]]):
+        """Append chunks with their metadata to their region files, one write per region (safe to call
+        off the loop)"""
+        by_region: Dict[Tuple[int, int, int], List[Tuple[int, bytes]]] = {}
+        for key, chunk in items:
+            if isinstance(chunk, PackedChunk):
+                chunk = chunk.unpack()
+            meta = orjson.dumps(self.chunk_metadata.get(key, {}))
+            record = b''.join((_RECORD_HEAD.pack(int(ZSTD_AVAILABLE), len(meta)), meta, _encode_chunk_file(chunk)))
+            region_key, slot = _region_slot(key)
+            by_region.setdefault(region_key, []).append((slot, record))
+        for region_key, records in by_region.items():
+            self._region(region_key).append(records)
+
+    def _write_behind(self, items: List[Tuple[Tuple[int, int, int], PackedChunk]]) -> asyncio.Future:
+        """Write a batch of chunks to disk as one executor job instead of blocking the event loop on
+        each file; until it finishes the chunks are still served from _unwritten"""
+        for key, chunk in items:
+            self._unwritten[key] = chunk
+        job = asyncio.get_running_loop().run_in_executor(self.executor, self._save_chunks_to_disk, items)
+        self._write_jobs.add(job)
+        job.add_done_callback(functools.partial(self._on_chunks_written, items))
+        return job
+
+    def _on_chunks_written(self, items: List[Tuple[Tuple[int, int, int], PackedChunk]], job: asyncio.Future):
+        self._write_jobs.discard(job)
+        failed = job.cancelled() or job.exception() is not None
+        if failed:
+            logger.error(f"Failed to write {len(items)} chunks to disk: {'cancelled' if job.cancelled() else job.exception()}")
+        else:
+            self.chunks_on_disk.update(key for key, _ in items)
+        for key, chunk in items:
+            # A later write of the same chunk owns the entry now
+            if self._unwritten.get(key) is not chunk:
+                continue
+            del self._unwritten[key]
+            if failed and self._stopping:
+                # Re-caching could evict into an executor that is about to shut down
+                self._unsaved[key] = chunk
+            elif failed:
+                # This may be the only copy left: mark it dirty again, re-caching it if it was evicted
+                if key in self.chunk_cache:
+                    if key not in self._dirty:
+                        self._dirty.add(key)
+                        self._swap_queue.put_nowait(key)
+                else:
+                    self._cache_chunk(key, chunk)
+
+    async def _swap_worker(self):
+        """Persist newly cached chunks in the background, a batch per executor job"""
+        while True:
+            keys = [await self._swap_queue.get()]
+            while len(keys) < self._swap_batch_size and not self._swap_queue.empty():
+                keys.append(self._swap_queue.get_nowait())
+            # Chunks evicted while queued were written by the eviction itself
+            items = [(key, self.chunk_cache[key]) for key in keys
+                     if key in self._dirty and key in self.chunk_cache]
+            self._dirty.difference_update(keys)
+            if items:
+                # wait() rather than await, so cancelling the worker doesn't cancel a write in progress
+                await asyncio.wait([self._write_behind(items)])
 
     def _load_chunk_from_disk(self, key: Tuple[int, int, int]) -> Optional[np.ndarray]:
-        """Load chunk from disk"""
+        """Load chunk from its region file, or from a per-chunk file written by an older version"""
+        region_key, slot = _region_slot(key)
+        region = self._regions.get(region_key)
+        record = region.read(slot) if region is not None else None
+        if record is not None:
+            try:
+                codec, meta_len = _RECORD_HEAD.unpack_from(record)
+                meta_end = _RECORD_HEAD.size + meta_len
+                self.chunk_metadata[key] = orjson.loads(record[_RECORD_HEAD.size:meta_end])
+                data = _decode_chunk_file(_RECORD_CODECS[codec], record[meta_end:])
+                return np.frombuffer(data, dtype=np.uint8).reshape((self.chunk_size,) * 3)
+            except Exception as e:
+                logger.error(f"Failed to load chunk {key} from {region.path.name}: {e}")
+                return None
         x, y, z = key
-        chunk_file = self.world_path / f"chunk_{x}_{y}_{z}.npz"
-        if chunk_file.exists():
+        stem = self.world_path / f"chunk_{x}_{y}_{z}"
+        for suffix in _CHUNK_SUFFIXES:
+            chunk_file = stem.with_suffix(suffix)
+            if not chunk_file.exists():
+                continue
             try:
-                with gzip.open(chunk_file, 'rb') as f:
-                    data = np.load(f, allow_pickle=True)
-                    chunk = data['chunk']
-                    if 'metadata' in data:
-                        self.chunk_metadata[key] = data['metadata'].item()
-                    return chunk
+                with open(chunk_file, 'rb') as f:
+                    data = _decode_chunk_file(suffix, f.read())
+                meta_file = stem.with_suffix('.json')
+                if meta_file.exists():
+                    self.chunk_metadata[key] = orjson.loads(meta_file.read_bytes())
+                return np.frombuffer(data, dtype=np.uint8).reshape((self.chunk_size,) * 3)
             except Exception as e:
                 logger.error(f"Failed to load chunk {key} from disk: {e}")
         return None
 
     async def start(self):
         """Start the batch processor"""
+        if NUMBA_AVAILABLE:
+            # Compile (or load the cached) batch kernel now rather than on the first request
+            self._generate_batch_nb([(0, 0, 0)])
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
         if self.processing_task is None:
             self.processing_task = asyncio.create_task(self._process_batches())
+        if self._swap_task is None:
+            self._swap_task = asyncio.create_task(self._swap_worker())
     
     async def stop(self):
         """Stop the batch processor"""
+        self._stopping = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
         if self.processing_task:
             self.processing_task.cancel()
             await asyncio.gather(self.processing_task, return_exceptions=True)
             self.processing_task = None
+        if self._swap_task:
+            self._swap_task.cancel()
+            await asyncio.gather(self._swap_task, return_exceptions=True)
+            self._swap_task = None
+        # Write what is still dirty and let swapped-out chunks finish writing, retrying failed writes a
+        # few times; the executor has to outlive every write job
+        for _ in range(self._stop_write_attempts):
+            items = [(key, self.chunk_cache[key]) for key in self._dirty if key in self.chunk_cache]
+            items.extend(self._unsaved.items())
+            self._dirty.clear()
+            self._unsaved.clear()
+            if items:
+                self._write_behind(items)
+            while self._write_jobs:
+                await asyncio.gather(*self._write_jobs, return_exceptions=True)
+            if not self._unsaved and not self._dirty:
+                break
+        lost = sorted(self._unsaved.keys() | self._dirty)
+        if lost:
+            logger.error(f"Lost {len(lost)} chunks that could not be written before shutdown: {lost}")
         self.executor.shutdown(wait=True)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
     
     async def process_chunk(self, x: int, y: int, z: int) -> np.ndarray:
         """Request chunk processing with persistent caching and disk storage"""
         key = (x, y, z)
         
-        # Update access time
-        self.chunk_access_time[key] = time.time()
-        
         # Check memory cache first
-        if key in self.chunk_cache:
-            return self.chunk_cache[key]
+        packed = self.chunk_cache.get(key)
+        if packed is not None:
+            self.chunk_cache.move_to_end(key)
+            return packed.unpack()
+        
+        # Swapped out but its file is still being written
+        packed = self._unwritten.get(key)
+        if packed is not None:
+            self._cache_chunk(key, packed)
+            return packed.unpack()
         
         # Check disk cache
         if key in self.chunks_on_disk:
-            chunk = await asyncio.get_event_loop().run_in_executor(
+            chunk = await asyncio.get_running_loop().run_in_executor(
                 self.executor, self._load_chunk_from_disk, key
             )
             if chunk is not None:
                 self._cache_chunk(key, chunk)
                 return chunk
         
-        future = asyncio.Future()
-        
-        async with self.processing_lock:
+        # No await between the lookup and the insert, so registering a request is atomic on the loop
+        # and only batch creation itself needs processing_lock
+        shared = self.in_flight.get(key)
+        if shared is None:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            if key not in self.pending_requests:
+                self.pending_requests[key] = []
+                self._pending_order.append(key)
             self.pending_requests[key].append(future)
+            self._pending_count += 1
             
             # Check if we should trigger a batch
-            total_pending = sum(len(futures) for futures in self.pending_requests.values())
-            if total_pending >= self.batch_size:
-                await self._create_batch()
-        
-        result = await future
+            if self._pending_count >= self.batch_size:
+                if self._flush_handle is not None:
+                    self._flush_handle.cancel()
+                    self._flush_handle = None
+                async with self.processing_lock:
+                    await self._create_batch()
+                self._arm_flush_timer()
+            elif self._flush_handle is None:
+                self._arm_flush_timer()
         
-        # Cache the result for persistent storage
-        self._cache_chunk(key, result)
+        if shared is not None:
+            # Already queued or generating; wait on that result instead of generating the chunk again
+            return await asyncio.shield(shared)
         
-        return result
+        # _deliver_batches has cached the chunk by the time this resolves
+        return await asyncio.shield(future)
     
+    def _arm_flush_timer(self):
+        """Start the max-wait timer for the oldest pending request, if there is one and no timer yet"""
+        if self._pending_count and self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_timeout, self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self._flush_partial())
+
+    async def _flush_partial(self):
+        """Queue the oldest pending requests once they have waited batch_timeout"""
+        async with self.processing_lock:
+            await self._create_batch()
+        self._arm_flush_timer()
+
     async def _create_batch(self):
         """Create a batch of chunks to process"""
         batch = []
         
-        for coord, futures in list(self.pending_requests.items()):
-            if futures:
-                batch.append((coord, futures))
-                if len(batch) >= self.batch_size:
-                    break
-        
-        # Remove batched items
-        for coord, _ in batch:
-            del self.pending_requests[coord]
+        # Oldest requests first; each coord is taken out of the pending structures as it is batched
+        while self._pending_order and len(batch) < self.batch_size:
+            coord = self._pending_order.popleft()
+            futures = self.pending_requests.pop(coord)
+            self._pending_count -= len(futures)
+            batch.append((coord, futures))
         
         if batch:
             await self.batch_queue.put(batch)
     
     async def _process_batches(self):
-        """Process batches of chunks"""
-        while True:
-            try:
+        """Start batches as they arrive and hand them to _deliver_batches, so the next batch is already
+        computing while the previous one's futures are being resolved"""
+        started: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.pipeline_depth - 1))
+        deliver_task = asyncio.create_task(self._deliver_batches(started))
+        try:
+            while True:
                 batch = await self.batch_queue.get()
-                start_time = time.time()
-                
-                # Process batch in parallel
                 coords = [coord for coord, _ in batch]
+                work = asyncio.ensure_future(self._run_batch(coords))
+                # Blocks once pipeline_depth batches are in flight
+                await started.put((batch, work, time.time()))
+        except asyncio.CancelledError:
+            deliver_task.cancel()
+            await asyncio.gather(deliver_task, return_exceptions=True)
+    
+    async def _run_batch(self, coords: List[Tuple[int, int, int]]) -> List[np.ndarray]:
+        # Run CPU-intensive processing in the process pool when there is one, else the thread pool
+        if self.process_pool is not None:
+            return await self._process_chunk_batch_in_pool(coords)
+        start = time.perf_counter()
+        results = await self._loop.run_in_executor(
+            self.executor,
+            self._process_chunk_batch,
+            coords
+        )
+        if self.gpu_available:
+            self._tune_batch_size(len(coords), time.perf_counter() - start)
+        return results
+    
+    def _tune_batch_size(self, num_chunks: int, seconds: float):
+        """Adjust batch_size every _tune_interval full batches from the measured time per chunk"""
+        # Partial batches carry the same fixed launch cost over fewer chunks, and batches created before
+        # the last adjustment have a different size; neither says anything about the current size
+        if num_chunks != self.batch_size:
+            return
+        ms = seconds * 1000 / num_chunks
+        self._ms_per_chunk = ms if self._ms_per_chunk is None else 0.8 * self._ms_per_chunk + 0.2 * ms
+        self._batches_since_tune += 1
+        if self._batches_since_tune < self._tune_interval:
+            return
+        self._batches_since_tune = 0
+        previous, self._tuned_ms_per_chunk = self._tuned_ms_per_chunk, self._ms_per_chunk
+        old_size = self.batch_size
+        if previous is None or self._ms_per_chunk < 0.9 * previous:
+            self.batch_size = min(self.max_batch_size, int(old_size * 1.25))
+        elif self._ms_per_chunk > 1.05 * previous:
+            self.batch_size = max(1, int(old_size * 0.8))
+        if self.batch_size != old_size:
+            # The EMA was measured at the old size; start fresh so the next step compares like with like
+            self._ms_per_chunk = None
+            logger.debug(f"GPU batch size {old_size} -> {self.batch_size} "
+                         f"({self._tuned_ms_per_chunk:.3f} ms/chunk)")
+    
+    async def _deliver_batches(self, started: asyncio.Queue):
+        """Resolve request futures for started batches, in submission order"""
+        while True:
+            batch, work, start_time = await started.get()
+            try:
+                results = await work
                 
-                # Run CPU-intensive processing in thread pool
-                loop = asyncio.get_event_loop()
-                results = await loop.run_in_executor(
-                    self.executor,
-                    self._process_chunk_batch,
-                    coords
-                )
-                
-                # Deliver results
+                # Deliver results, caching each chunk first so a request for it arriving between
+                # set_result and its waiters resuming hits the cache rather than starting a new batch
                 for i, (coord, futures) in enumerate(batch):
                     result = results[i]
+                    # Shared by every waiter on this chunk, like the copies handed out on cache hits
+                    result.setflags(write=False)
+                    self._cache_chunk(coord, result)
                     for future in futures:
                         if not future.done():
                             future.set_result(result)
@@ -261,7 +996,7 @@ class ChunkProcessor:
                 logger.debug(f"Processed batch of {len(batch)} chunks in {process_time:.3f}s")
                 
             except asyncio.CancelledError:
-                break
+                raise
             except Exception as e:
                 logger.error(f"Error processing batch: {e}")
                 # Set error on all futures
@@ -270,6 +1005,17 @@ class ChunkProcessor:
                         if not future.done():
                             future.set_exception(e)
     
+    async def _process_chunk_batch_in_pool(self, coords: List[Tuple[int, int, int]]) -> List[np.ndarray]:
+        """Generate a batch in a worker process; the chunks come back as one byte blob to keep IPC cheap"""
+        blob, metadata = await self._loop.run_in_executor(
+            self.process_pool, _generate_batch_cpu, coords, self.chunk_size,
+            self.detail_octaves, self.biome_scale, self.resource_density
+        )
+        batch_buf = np.frombuffer(blob, dtype=np.uint8).reshape(len(coords), self.chunk_size, self.chunk_size, self.chunk_size)
+        for key, meta in zip(coords, metadata):
+            self.chunk_metadata[key] = meta
+        return [batch_buf[idx] for idx in range(len(coords))]
+    
     def _process_chunk_batch(self, coords: List[Tuple[int, int, int]]) -> List[np.ndarray]:
         """Process multiple chunks in parallel with GPU acceleration"""
         if self.gpu_available:
@@ -280,242 +1026,127 @@ class ChunkProcessor:
         return self._process_chunk_batch_cpu(coords)
     
     def _process_chunk_batch_gpu(self, coords: List[Tuple[int, int, int]]) -> List[np.ndarray]:
-        """Process chunks on GPU for massive performance boost"""
-        results = []
-        
+        """Process the whole batch on GPU as one (N, 16, 16, 16) tensor, so kernel launches don't scale with N"""
         num_chunks = len(coords)
-        chunk_data_gpu = cp.zeros((num_chunks, self.chunk_size, self.chunk_size, self.chunk_size), dtype=cp.uint8)
+        cs = self.chunk_size
         
-        for idx, (x, y, z) in enumerate(coords):
-            # Create coordinate grids on GPU
-            i_coords = cp.arange(self.chunk_size)
-            j_coords = cp.arange(self.chunk_size)
-            k_coords = cp.arange(self.chunk_size)
-            ii, jj, kk = cp.meshgrid(i_coords, j_coords, k_coords, indexing='ij')
-            
-            world_x = x * self.chunk_size + ii
-            world_y = y * self.chunk_size + jj
-            world_z = z * self.chunk_size + kk
-            
-            # Multi-octave noise for terrain
-            height_map = cp.zeros_like(world_x, dtype=cp.float32)
-            amplitude = 64.0
-            frequency = 0.01
-            
-            for octave in range(self.detail_octaves):
-                height_map += (
-                    cp.sin(world_x * frequency) * amplitude +
-                    cp.cos(world_z * frequency) * amplitude +
-                    cp.sin((world_x + world_z) * frequency * 0.5) * amplitude * 0.5
-                )
-                amplitude *= 0.5
-                frequency *= 2.0
-            
-            height_map += 64
-            
-            # Biome variation
-            biome_noise = cp.sin(world_x * self.biome_scale) * cp.cos(world_z * self.biome_scale)
-            height_map += biome_noise * 16
-            
-            # Generate terrain
-            chunk_gpu = cp.zeros_like(world_y, dtype=cp.uint8)
-            chunk_gpu[world_y < 1] = 7  # Bedrock
-            
-            stone_mask = (world_y >= 1) & (world_y < height_map - 5)
-            chunk_gpu[stone_mask] = 1
-            
-            dirt_mask = (world_y >= height_map - 5) & (world_y < height_map)
-            chunk_gpu[dirt_mask] = 2
-            
-            grass_mask = (world_y >= height_map) & (world_y < height_map + 1)
-            chunk_gpu[grass_mask] = 3
-            
-            # Generate all ore types
-            if cp.any(stone_mask):
-                # Coal
-                coal_mask = (world_y > 5) & (world_y < 100) & stone_mask & (cp.random.random(chunk_gpu.shape) < self.resource_density['coal'])
-                chunk_gpu[coal_mask] = 16
-                
-                # Iron
-                iron_mask = (world_y > 5) & (world_y < 64) & stone_mask & (cp.random.random(chunk_gpu.shape) < self.resource_density['iron'])
-                chunk_gpu[iron_mask] = 15
-                
-                # Gold
-                gold_mask = (world_y > 5) & (world_y < 32) & stone_mask & (cp.random.random(chunk_gpu.shape) < self.resource_density['gold'])
-                chunk_gpu[gold_mask] = 14
-                
-                # Diamond
-                diamond_mask = (world_y > 1) & (world_y < 16) & stone_mask & (cp.random.random(chunk_gpu.shape) < self.resource_density['diamond'])
-                chunk_gpu[diamond_mask] = 56
-            
-            # Caves
-            cave_noise1 = cp.sin(world_x * 0.1) * cp.cos(world_y * 0.1) * cp.sin(world_z * 0.1)
-            cave_noise2 = cp.cos(world_x * 0.08) * cp.sin(world_y * 0.08) * cp.cos(world_z * 0.08)
-            cave_mask = (cp.abs(cave_noise1 + cave_noise2) < 0.1) & (world_y > 5) & (world_y < height_map - 5)
-            chunk_gpu[cave_mask] = 0
-            
-            chunk_data_gpu[idx] = chunk_gpu
-            results.append(cp.asnumpy(chunk_gpu))
+        # Chunk origins in world blocks, scaled on the host so the upload is the only transfer in
+        origins = cp.asarray(np.asarray(coords, dtype=np.int32) * cs)
         
-        # Free GPU memory
-        try:
-            cp.get_default_memory_pool().free_all_blocks()
-        except Exception:
-            pass
+        # Height, terrain, ores and caves for every chunk in the batch with one kernel launch
+        bands = _ore_bands(tuple(self.resource_density[ore] for ore, *_ in _ORES))
+        chunks_gpu = cp.empty((num_chunks, cs, cs, cs), dtype=cp.uint8)
+        _chunk_blocks_kernel(origins, cs, self.detail_octaves, self.biome_scale, *bands, chunks_gpu)
+        
+        # One device-to-host copy for the whole batch; callers get views into it. Kept at a byte per
+        # block: ore ids (16, 56) don't fit a nibble, and unpacking a palette-packed batch on the host
+        # costs far more than the PCIe time it would save
+        batch_buf = self._copy_to_host(chunks_gpu)
+        results = [batch_buf[idx] for idx in range(num_chunks)]
+        
+        # Keep pooled blocks for the next batch (same shapes, no cudaMalloc); only hand them back to
+        # the driver once the pool has grown past the soft cap
+        mempool = cp.get_default_memory_pool()
+        if mempool.total_bytes() > self._mempool_soft_cap:
+            mempool.free_all_blocks()
         
         return results
     
+    def _copy_to_host(self, chunks_gpu) -> np.ndarray:
+        """Copy a batch to host through the pinned staging buffer on the copy stream"""
+        if self._copy_stream is None:
+            return cp.asnumpy(chunks_gpu)
+        with self._gpu_copy_lock:
+            return self._copy_to_host_pinned(chunks_gpu)
+    
+    def _copy_to_host_pinned(self, chunks_gpu) -> np.ndarray:
+        if self._host_buf is None or self._host_buf.shape[0] < chunks_gpu.shape[0]:
+            self._host_buf = cupyx.empty_pinned(chunks_gpu.shape, dtype=np.uint8)
+        host = self._host_buf[:chunks_gpu.shape[0]]
+        # The copy stream must not start before the generation kernels have finished
+        compute_done = cp.cuda.get_current_stream().record()
+        self._copy_stream.wait_event(compute_done)
+        chunks_gpu.get(stream=self._copy_stream, out=host)
+        self._copy_stream.synchronize()
+        # The staging buffer is reused by the next batch, so hand out a pageable copy
+        return host.copy()
+    
     def _process_chunk_batch_cpu(self, coords: List[Tuple[int, int, int]]) -> List[np.ndarray]:
-        """Process chunks on CPU with optimized memory usage"""
-        results = []
-        available_memory = psutil.virtual_memory().available
-        chunk_memory = self.chunk_size ** 3 * np.dtype(np.uint8).itemsize
-        max_chunks_in_memory = int((available_memory * self.max_memory_percent) / chunk_memory)
-        logger.debug(f"Processing {len(coords)} chunks, max in memory: {max_chunks_in_memory}")
-        for i in range(0, len(coords), max_chunks_in_memory):
-            batch = coords[i:i + max_chunks_in_memory]
-            batch_size = len(batch)
-            chunk_batch = np.zeros((batch_size, self.chunk_size, self.chunk_size, self.chunk_size), dtype=np.uint8)
-            for idx, (x, y, z) in enumerate(batch):
-                chunk_batch[idx] = self._generate_optimized_chunk_cpu(x, y, z)
-            results.extend(chunk_batch)
-        return results
+        """Process chunks on CPU into one contiguous (N, 16, 16, 16) buffer and return per-chunk views"""
+        if NUMBA_AVAILABLE:
+            return self._generate_batch_nb(coords)
+        batch_buf = np.empty((len(coords), self.chunk_size, self.chunk_size, self.chunk_size), dtype=np.uint8)
+        for idx, (x, y, z) in enumerate(coords):
+            self._generate_optimized_chunk_cpu(x, y, z, out=batch_buf[idx])
+        return [batch_buf[idx] for idx in range(len(coords))]
     
-    def _generate_optimized_chunk_cpu(self, x: int, y: int, z: int) -> np.ndarray:
-        """Generate chunk data with enhanced terrain and resources"""
-        chunk = np.zeros((self.chunk_size, self.chunk_size, self.chunk_size), dtype=np.uint8)
-        
-        # Create coordinate grids
-        i_coords = np.arange(self.chunk_size)
-        j_coords = np.arange(self.chunk_size)
-        k_coords = np.arange(self.chunk_size)
-        ii, jj, kk = np.meshgrid(i_coords, j_coords, k_coords, indexing='ij')
-        
-        # World coordinates
-        world_x = x * self.chunk_size + ii
-        world_y = y * self.chunk_size + jj
-        world_z = z * self.chunk_size + kk
-        
-        # Multi-octave noise for realistic terrain
-        height_map = np.zeros_like(world_x, dtype=np.float32)
-        amplitude = 64.0
-        frequency = 0.01
-        
-        for octave in range(self.detail_octaves):
-            height_map += (
-                np.sin(world_x * frequency) * amplitude +
-                np.cos(world_z * frequency) * amplitude +
-                np.sin((world_x + world_z) * frequency * 0.5) * amplitude * 0.5
-            )
-            amplitude *= 0.5
-            frequency *= 2.0
-        
-        height_map += 64  # Base height
-        
-        # Biome variation
-        biome_noise = np.sin(world_x * self.biome_scale) * np.cos(world_z * self.biome_scale)
-        height_map += biome_noise * 16
-        
-        # Generate terrain layers
-        chunk[world_y < 1] = 7  # Bedrock
-        
-        # Deep stone layer
-        stone_mask = (world_y >= 1) & (world_y < height_map - 5)
-        chunk[stone_mask] = 1
-        
-        # Dirt layer
-        dirt_mask = (world_y >= height_map - 5) & (world_y < height_map)
-        chunk[dirt_mask] = 2
-        
-        # Grass/sand on top based on biome
-        grass_mask = (world_y >= height_map) & (world_y < height_map + 1)
-        chunk[grass_mask] = 3
-        
-        # Generate ores with realistic distribution
-        if stone_mask.any():
-            # Coal - most common, higher levels
-            coal_height = (world_y > 5) & (world_y < 100) & stone_mask
-            coal_noise = np.random.random(chunk.shape) < self.resource_density['coal']
-            chunk[coal_height & coal_noise] = 16  # Coal ore
-            
-            # Iron - common, mid levels
-            iron_height = (world_y > 5) & (world_y < 64) & stone_mask
-            iron_noise = np.random.random(chunk.shape) < self.resource_density['iron']
-            chunk[iron_height & iron_noise] = 15  # Iron ore
-            
-            # Gold - rare, low levels
-            gold_height = (world_y > 5) & (world_y < 32) & stone_mask
-            gold_noise = np.random.random(chunk.shape) < self.resource_density['gold']
-            chunk[gold_height & gold_noise] = 14  # Gold ore
-            
-            # Diamond - very rare, deep levels
-            diamond_height = (world_y > 1) & (world_y < 16) & stone_mask
-            diamond_noise = np.random.random(chunk.shape) < self.resource_density['diamond']
-            chunk[diamond_height & diamond_noise] = 56  # Diamond ore
-            
-            # Redstone - deep levels
-            redstone_height = (world_y > 1) & (world_y < 16) & stone_mask
-            redstone_noise = np.random.random(chunk.shape) < self.resource_density['redstone']
-            chunk[redstone_height & redstone_noise] = 73  # Redstone ore
-            
-            # Lapis - mid levels
-            lapis_height = (world_y > 10) & (world_y < 40) & stone_mask
-            lapis_noise = np.random.random(chunk.shape) < self.resource_density['lapis']
-            chunk[lapis_height & lapis_noise] = 21  # Lapis ore
-        
-        # Add caves (3D noise for realistic cave systems)
-        cave_noise1 = np.sin(world_x * 0.1) * np.cos(world_y * 0.1) * np.sin(world_z * 0.1)
-        cave_noise2 = np.cos(world_x * 0.08) * np.sin(world_y * 0.08) * np.cos(world_z * 0.08)
-        cave_mask = (np.abs(cave_noise1 + cave_noise2) < 0.1) & (world_y > 5) & (world_y < height_map - 5)
-        chunk[cave_mask] = 0  # Air in caves
-        
-        # Store metadata
-        self.chunk_metadata[(x, y, z)] = {
-            'generated_at': time.time(),
-            'biome': 'plains' if biome_noise.mean() > 0 else 'desert',
-            'has_ores': bool(chunk[chunk > 10].any())
-        }
-        
+    def _generate_batch_nb(self, coords: List[Tuple[int, int, int]]) -> List[np.ndarray]:
+        """Generate a batch with the parallel Numba kernel; runs without the GIL across all cores."""
+        xs, ys, zs = (np.array(axis, dtype=np.int64) for axis in zip(*coords))
+        out = np.empty((len(coords), self.chunk_size, self.chunk_size, self.chunk_size), dtype=np.uint8)
+        biome_means = np.empty(len(coords), dtype=np.float64)
+        bands = _ore_bands(tuple(self.resource_density[ore] for ore, *_ in _ORES))
+        # Numba's default workqueue threading layer does not support concurrent parallel launches
+        with self._numba_lock:
+            _generate_chunks_nb(xs, ys, zs, out, biome_means, self.detail_octaves, self.biome_scale,
+                                bands, _ORE_IDS, _ORE_MIN_Y, _ORE_MAX_Y)
+        now = time.time()
+        for n, key in enumerate(coords):
+            self.chunk_metadata[key] = {
+                'generated_at': now,
+                'biome': 'plains' if biome_means[n] > 0 else 'desert',
+                'has_ores': bool((out[n] > 10).any())
+            }
+        return [out[n] for n in range(len(coords))]
+
+    def _generate_optimized_chunk_cpu(self, x: int, y: int, z: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Generate chunk data with enhanced terrain and resources, writing into `out` when given"""
+        chunk = np.empty((self.chunk_size, self.chunk_size, self.chunk_size), dtype=np.uint8) if out is None else out
+        self.chunk_metadata[(x, y, z)] = _generate_chunk_into(chunk, x, y, z, self.detail_octaves,
+                                                              self.biome_scale, self.resource_density)
         return chunk
     
-    def _cache_chunk(self, key: Tuple[int, int, int], chunk: np.ndarray):
+    def _cache_chunk(self, key: Tuple[int, int, int], chunk: Any):
         """Cache chunk with automatic disk swapping for unlimited world size"""
-        # Check memory limit
-        if len(self.chunk_cache) >= self.max_memory_chunks:
-            # Find oldest accessed chunks to swap to disk
-            sorted_chunks = sorted(self.chunk_access_time.items(), key=lambda x: x[1])
-            chunks_to_swap = sorted_chunks[:len(sorted_chunks) // 4]  # Swap 25% of oldest chunks
-            
-            for chunk_key, _ in chunks_to_swap:
-                if chunk_key in self.chunk_cache:
-                    # Save to disk before removing from memory
-                    self._save_chunk_to_disk(chunk_key, self.chunk_cache[chunk_key])
-                    del self.chunk_cache[chunk_key]
-                    del self.chunk_access_time[chunk_key]
-            
-            self._save_world_index()
-            logger.info(f"Swapped {len(chunks_to_swap)} chunks to disk, memory cache: {len(self.chunk_cache)}")
+        packed = chunk if isinstance(chunk, PackedChunk) else PackedChunk(chunk)
+        previous = self.chunk_cache.pop(key, None)
+        if previous is not None:
+            self._cache_bytes -= previous.nbytes
         
-        # Store chunk in memory
-        self.chunk_cache[key] = chunk.copy()
+        # Evict just enough of the least recently used chunks (the front of the cache) to fit this one
+        dirty = []
+        while self.chunk_cache and self._cache_bytes + packed.nbytes > self.max_memory_bytes:
+            old_key, old_chunk = self.chunk_cache.popitem(last=False)
+            self._cache_bytes -= old_chunk.nbytes
+            # Most are already on disk via _swap_worker; only the still-dirty ones need writing now
+            if old_key in self._dirty:
+                self._dirty.discard(old_key)
+                dirty.append((old_key, old_chunk))
+        if dirty:
+            self._write_behind(dirty)
         
-        # Save to disk periodically for persistence
-        if len(self.chunk_cache) % 50 == 0:
-            self._save_chunk_to_disk(key, chunk)
-            self._save_world_index()
+        # Store chunk in memory
+        self.chunk_cache[key] = packed
+        self._cache_bytes += packed.nbytes
+        if key not in self.chunks_on_disk and key not in self._dirty:
+            self._dirty.add(key)
+            self._swap_queue.put_nowait(key)
 
     def get_world_stats(self) -> Dict[str, Any]:
         """Get comprehensive statistics about the stored world"""
-        memory_chunks = len(self.chunk_cache)
+        # A chunk can be cached and on disk at once, or evicted with its write still pending
+        cached = self.chunk_cache.keys()
+        all_keys = cached | self.chunks_on_disk | self._unwritten.keys()
+        memory_chunks = len(cached)
         disk_chunks = len(self.chunks_on_disk)
-        total_chunks = memory_chunks + disk_chunks
+        total_chunks = len(all_keys)
         
-        memory_bytes = memory_chunks * (self.chunk_size ** 3)
+        memory_bytes = self._cache_bytes
         memory_mb = memory_bytes / (1024 * 1024)
         memory_gb = memory_mb / 1024
         
         # Calculate world bounds from both memory and disk
-        all_coords = list(self.chunk_cache.keys()) + list(self.chunks_on_disk)
+        all_coords = all_keys
         
         if all_coords:
             min_x = min(coord[0] for coord in all_coords)
@@ -536,6 +1167,8 @@ class ChunkProcessor:
             'chunk_count': total_chunks,
             'memory_chunks': memory_chunks,
             'disk_chunks': disk_chunks,
+            'memory_only_chunks': len(cached - self.chunks_on_disk),
+            'disk_only_chunks': len(self.chunks_on_disk - cached),
             'memory_mb': memory_mb,
             'memory_gb': memory_gb,
             'world_bounds': {
@@ -550,23 +1183,37 @@ class ChunkProcessor:
 
     async def pregenerate_area(self, center_x: int, center_z: int, radius_chunks: int):
         """Pregenerate chunks in a radius for faster loading"""
-        tasks = []
+        coords = []
         for dx in range(-radius_chunks, radius_chunks + 1):
             for dz in range(-radius_chunks, radius_chunks + 1):
                 for dy in range(-4, 12):  # Y levels from -64 to 192
                     if dx * dx + dz * dz <= radius_chunks * radius_chunks:
-                        tasks.append(self.process_chunk(center_x + dx, dy, center_z + dz))
+                        key = (center_x + dx, dy, center_z + dz)
+                        if (key not in self.chunk_cache and key not in self.chunks_on_disk
+                                and key not in self._unwritten and key not in self.in_flight):
+                            coords.append(key)
         
-        # Process in batches to avoid overwhelming the system
-        batch_size = 100
-        for i in range(0, len(tasks), batch_size):
-            batch = tasks[i:i + batch_size]
-            await asyncio.gather(*batch)
-            logger.info(f"Pregenerated {min(i + batch_size, len(tasks))}/{len(tasks)} chunks")
+        # Generate straight into the cache in large batches rather than queueing a request per chunk;
+        # the GPU takes each batch in one launch, the CPU paths split it across their workers
+        step = min(self._pregen_batch_size, self.max_batch_size) if self.gpu_available else self._pregen_batch_size
+        for i in range(0, len(coords), step):
+            batch = coords[i:i + step]
+            if self.gpu_available:
+                results = await self._run_batch(batch)
+            else:
+                parts = await asyncio.gather(*(self._run_batch(batch[j:j + self.batch_size])
+                                               for j in range(0, len(batch), self.batch_size)))
+                results = [chunk for part in parts for chunk in part]
+            for key, chunk in zip(batch, results):
+                chunk.setflags(write=False)
+                self._cache_chunk(key, chunk)
+            logger.info(f"Pregenerated {i + len(batch)}/{len(coords)} chunks")
 
     async def save_all_chunks(self):
         """Save all chunks in memory to disk"""
-        for key, chunk in self.chunk_cache.items():
-            self._save_chunk_to_disk(key, chunk)
-        self._save_world_index()
-        logger.info(f"Saved {len(self.chunk_cache)} chunks to disk")
+        # Chunks never change once generated, and rewriting one only appends a second copy to its region
+        items = [(key, chunk) for key, chunk in self.chunk_cache.items() if key not in self.chunks_on_disk]
+        self._dirty.difference_update(key for key, _ in items)
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._save_chunks_to_disk, items)
+        self.chunks_on_disk.update(key for key, _ in items)
+        logger.info(f"Saved {len(items)} chunks to disk")
@@ -1,17 +1,43 @@
 import asyncio
-import json
+import io
+import orjson
 import os
 import zlib
+import struct
+import time
 import numpy as np
 import pickle
-from typing import Dict, Optional, Tuple, Set
+from typing import Dict, Iterable, Optional, Tuple, Set
 from pathlib import Path
 import logging
-import aiofiles
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Chunks are stored at a fixed stride in one memory-mapped file: slot n holds chunk bytes [n*4096, (n+1)*4096)
+CHUNK_SHAPE = (16, 16, 16)
+INITIAL_SLOTS = 1024
+
+# Index changes are appended to metadata.log as fixed-size records (x, y, z, slot, blocks, timestamp ns)
+# and folded into the metadata.json snapshot once the log holds SNAPSHOT_EVERY of them
+META_RECORD = struct.Struct('<iiiIIQ')
+SNAPSHOT_EVERY = 10000
+
+
+class _ChunkUnpickler(pickle.Unpickler):
+    """Legacy chunk files are pickled ndarrays; any other global is refused so a crafted file can't run code"""
+    ALLOWED = {
+        ('numpy', 'ndarray'), ('numpy', 'dtype'),
+        ('numpy.core.multiarray', '_reconstruct'), ('numpy._core.multiarray', '_reconstruct'),
+        ('numpy.core.numeric', '_frombuffer'), ('numpy._core.numeric', '_frombuffer'),
+        ('_codecs', 'encode'),  # how protocol 2 pickles spell bytes
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a chunk file")
+        return super().find_class(module, name)
+
 
 class ChunkStorage:
     """Persistent storage for chunk data to build up complete maps"""
@@ -20,90 +46,160 @@ class ChunkStorage:
         self.data_dir = Path(data_dir or os.getenv('DATA_DIR', 'data')) / 'chunks'
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.metadata_file = self.data_dir / 'metadata.json'
+        self.metadata_log = self.data_dir / 'metadata.log'
         self.chunk_index: Dict[Tuple[int, int, int], Dict] = {}
         self.write_lock = asyncio.Lock()
+        # Records not yet in metadata.log; written after the chunk bytes they describe are flushed
+        self._pending_records = bytearray()
+        self._log_records = 0
         self._load_metadata()
+        self.blob_file = self.data_dir / 'chunks.bin'
+        self.next_slot = 1 + max((meta['slot'] for meta in self.chunk_index.values() if 'slot' in meta), default=-1)
+        self.mm: Optional[np.memmap] = None
+        self._open_blob(max(INITIAL_SLOTS, self.next_slot))
     
     def _load_metadata(self):
-        """Load chunk metadata from disk"""
+        """Load the metadata snapshot, then replay the log of changes made since"""
         try:
             if self.metadata_file.exists():
-                with open(self.metadata_file, 'r') as f:
-                    data = json.load(f)
-                    # Convert string keys back to tuples
-                    self.chunk_index = {
-                        tuple(map(int, k.split(','))): v 
-                        for k, v in data.items()
-                    }
-                logger.info(f"Loaded metadata for {len(self.chunk_index)} chunks")
+                data = orjson.loads(self.metadata_file.read_bytes())
+                # Convert string keys back to tuples
+                self.chunk_index = {
+                    tuple(map(int, k.split(','))): v 
+                    for k, v in data.items()
+                }
         except Exception as e:
             logger.error(f"Error loading chunk metadata: {e}")
             self.chunk_index = {}
+        try:
+            if self.metadata_log.exists():
+                log = self.metadata_log.read_bytes()
+                torn = len(log) % META_RECORD.size
+                if torn:
+                    # A record torn by a crash mid-write is dropped, so later appends stay aligned
+                    log = log[:-torn]
+                    os.truncate(self.metadata_log, len(log))
+                for x, y, z, slot, blocks, ts_ns in META_RECORD.iter_unpack(log):
+                    self.chunk_index[(x, y, z)] = {
+                        'timestamp': datetime.utcfromtimestamp(ts_ns / 1e9).isoformat(),
+                        'slot': slot,
+                        'blocks': blocks
+                    }
+                self._log_records = len(log) // META_RECORD.size
+        except Exception as e:
+            logger.error(f"Error replaying chunk metadata log: {e}")
+        if self.chunk_index:
+            logger.info(f"Loaded metadata for {len(self.chunk_index)} chunks")
     
     async def save_metadata(self):
         """Save chunk metadata to disk"""
         async with self.write_lock:
             try:
-                # Convert tuple keys to strings for JSON
-                data = {
-                    f"{x},{y},{z}": meta 
-                    for (x, y, z), meta in self.chunk_index.items()
-                }
-                async with aiofiles.open(self.metadata_file, 'w') as f:
-                    await f.write(json.dumps(data, indent=2))
+                records, self._pending_records = bytes(self._pending_records), bytearray()
+                snapshot = None
+                self._log_records += len(records) // META_RECORD.size
+                if self._log_records >= SNAPSHOT_EVERY:
+                    # Convert tuple keys to strings for JSON
+                    snapshot = {f"{x},{y},{z}": meta for (x, y, z), meta in self.chunk_index.items()}
+                    self._log_records = 0
+                await asyncio.get_running_loop().run_in_executor(None, self._write_metadata, records, snapshot)
             except Exception as e:
                 logger.error(f"Error saving chunk metadata: {e}")
     
+    def _write_metadata(self, records: bytes, snapshot: Optional[Dict[str, Dict]]):
+        """Blocking part of save_metadata; runs on an executor thread"""
+        # Chunk bytes reach disk before the index that points at them
+        self.mm.flush()
+        if snapshot is not None:
+            tmp_file = self.metadata_file.with_suffix('.json.tmp')
+            tmp_file.write_bytes(orjson.dumps(snapshot))
+            os.replace(tmp_file, self.metadata_file)
+            # Replaying records already in the snapshot is harmless, so a crash before this is too
+            with open(self.metadata_log, 'wb'):
+                pass
+        elif records:
+            with open(self.metadata_log, 'ab') as f:
+                f.write(records)
+    
+    def _open_blob(self, slots: int):
+        """Map chunks.bin with room for at least `slots` chunks, growing the (sparse) file if needed"""
+        chunk_bytes = int(np.prod(CHUNK_SHAPE))
+        size = self.blob_file.stat().st_size if self.blob_file.exists() else 0
+        if size < slots * chunk_bytes:
+            with open(self.blob_file, 'ab') as f:
+                f.truncate(slots * chunk_bytes)
+            size = slots * chunk_bytes
+        if self.mm is not None:
+            self.mm.flush()
+        self.mm = np.memmap(self.blob_file, dtype=np.uint8, mode='r+', shape=(size // chunk_bytes, *CHUNK_SHAPE))
+
     def _get_chunk_path(self, x: int, y: int, z: int) -> Path:
-        """Get file path for a chunk"""
-        # Organize chunks by region for better file system performance
+        """Get the legacy per-chunk file path (chunks saved before chunks.bin existed)"""
         region_x = x // 32
         region_z = z // 32
-        region_dir = self.data_dir / f"r.{region_x}.{region_z}"
-        region_dir.mkdir(exist_ok=True)
-        return region_dir / f"c.{x}.{y}.{z}.dat"
+        return self.data_dir / f"r.{region_x}.{region_z}" / f"c.{x}.{y}.{z}.dat"
+
+    def _read_legacy_chunk(self, key: Tuple[int, int, int]) -> Optional[np.ndarray]:
+        """Blocking read + decode of one legacy chunk file; runs on an executor thread"""
+        try:
+            with open(self._get_chunk_path(*key), 'rb') as f:
+                return _ChunkUnpickler(io.BytesIO(zlib.decompress(f.read()))).load()
+        except Exception as e:
+            logger.error(f"Error loading chunk {key[0]},{key[1]},{key[2]}: {e}")
+            return None
     
     async def exists(self, x: int, y: int, z: int) -> bool:
         """Check if chunk exists in storage"""
         return (x, y, z) in self.chunk_index
     
+    async def exists_many(self, coords: Iterable[Tuple[int, int, int]]) -> Set[Tuple[int, int, int]]:
+        """Return the subset of coords that are in storage"""
+        return self.chunk_index.keys() & set(coords)
+    
     async def load(self, x: int, y: int, z: int) -> Optional[np.ndarray]:
         """Load chunk from persistent storage"""
-        if not await self.exists(x, y, z):
-            return None
-        
-        chunk_path = self._get_chunk_path(x, y, z)
-        try:
-            async with aiofiles.open(chunk_path, 'rb') as f:
-                compressed_data = await f.read()
-                decompressed = zlib.decompress(compressed_data)
-                return pickle.loads(decompressed)
-        except Exception as e:
-            logger.error(f"Error loading chunk {x},{y},{z}: {e}")
+        meta = self.chunk_index.get((x, y, z))
+        if meta is None:
             return None
+        if 'slot' in meta:
+            # A copy out of the page cache; no syscall once the page is resident
+            return np.array(self.mm[meta['slot']])
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_legacy_chunk, (x, y, z))
+
+    async def load_many(self, coords: Iterable[Tuple[int, int, int]]) -> Dict[Tuple[int, int, int], np.ndarray]:
+        """Load a batch of stored chunks; missing or unreadable chunks are skipped"""
+        chunks = {}
+        for key in coords:
+            if key in self.chunk_index:
+                data = await self.load(*key)
+                if data is not None:
+                    chunks[key] = data
+        return chunks
     
     async def save(self, x: int, y: int, z: int, data: np.ndarray):
         """Save chunk to persistent storage"""
-        chunk_path = self._get_chunk_path(x, y, z)
-        
         try:
-            # Compress data
-            serialized = pickle.dumps(data)
-            compressed = zlib.compress(serialized, level=6)
-            
-            # Write to disk
-            async with aiofiles.open(chunk_path, 'wb') as f:
-                await f.write(compressed)
+            slot = self.chunk_index.get((x, y, z), {}).get('slot')
+            if slot is None:
+                slot = self.next_slot
+                self.next_slot += 1
+                if slot >= self.mm.shape[0]:
+                    self._open_blob(self.mm.shape[0] * 2)
+            # Written straight into the mapping; the OS writes it back and save_metadata() flushes it
+            self.mm[slot] = data
             
             # Update metadata
+            ts_ns = time.time_ns()
+            blocks = int(np.count_nonzero(data))
             self.chunk_index[(x, y, z)] = {
-                'timestamp': datetime.utcnow().isoformat(),
-                'size': len(compressed),
-                'blocks': int(np.count_nonzero(data))
+                'timestamp': datetime.utcfromtimestamp(ts_ns / 1e9).isoformat(),
+                'slot': slot,
+                'blocks': blocks
             }
+            self._pending_records += META_RECORD.pack(x, y, z, slot, blocks, ts_ns)
             
             # Save metadata periodically (every 10 chunks)
-            if len(self.chunk_index) % 10 == 0:
+            if len(self._pending_records) >= 10 * META_RECORD.size:
                 await self.save_metadata()
                 
         except Exception as e:
@@ -24,8 +24,8 @@ import json
 import time
 import io
 import logging
-from uuid import uuid4
 from typing import Tuple, List, Dict, Optional
+from .utils import next_request_id
 
 logger = logging.getLogger(__name__)
 
@@ -69,7 +69,7 @@ async def request_chunk(websocket, dimension: str, x: int, z: int, y: Optional[i
     the original requested chunk coordinates.
     """
     if request_id is None:
-        request_id = str(uuid4())
+        request_id = next_request_id()
     # record normalized dimension and requested coords (including optional y)
     dim_str = _normalize_dimension(dimension)
     REQUEST_TO_COORDS[request_id] = (dim_str, int(x), int(z), int(y) if y is not None else None)
@@ -88,7 +88,7 @@ async def request_chunk(websocket, dimension: str, x: int, z: int, y: Optional[i
         }
     }
     await websocket.send(json.dumps(cmd))
-    logger.info(f"Requested chunk {dimension} {x} {z} with requestId={request_id}")
+    logger.debug("Requested chunk %s %s %s with requestId=%s", dimension, x, z, request_id)
     return request_id
 
 
@@ -193,7 +193,7 @@ def store_chunk(dimension: str, x: int, z: int, pixels: List[int], heights: List
     # Do not generate or store PNGs here; keep the stored data compact.
 
     CHUNK_STORE[key] = record
-    logger.info(f"Stored chunk {key} (request={request_id})")
+    logger.debug("Stored chunk %s (request=%s)", key, request_id)
     return record
 
 
@@ -1,187 +1,192 @@
-"""HTTP server and SimpleHTTPHandler moved from app.py"""
+"""HTTP API and static file server, running on the main asyncio loop via aiohttp."""
 import os
+import gzip
 import json
-import io
 import logging
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import mimetypes
+from aiohttp import web
 from . import state
 from . import chunk_store
-from .session import save_session_realtime
+from .session import flush_events, write_session_json
+from . import utils
 
 logger = logging.getLogger(__name__)
 
+STATIC_DIR = os.path.join(os.path.dirname(__file__), '..', 'static')
 
-class SimpleHTTPHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        static_dir = os.path.join(os.path.dirname(__file__), '..', 'static')
-        if self.path == '/':
-            self.path = '/index.html'
-        if self.path == '/api/server-info':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            # Use the external IP from environment or server detection
-            external_ip = os.getenv('EXTERNAL_IP') or os.getenv('SERVER_HOST') or 'localhost'
-            info = {
-                'external_ip': external_ip,
-                'minecraft_port': int(os.getenv('MINECRAFT_PORT', '19131')),
-                'ws_port': int(os.getenv('WS_PORT', '8081')),
-                'connection_string': f'/connect {external_ip}:{os.getenv("MINECRAFT_PORT", "19131")}'
-            }
-            self.wfile.write(json.dumps(info).encode())
-            return
-        if self.path.startswith('/api/export-session/'):
-            session_name = self.path.split('/')[-1]
-            session_file_path = os.path.join(state.DATA_DIR, f"{session_name}.json")
-            try:
-                if os.path.exists(session_file_path):
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Content-Disposition', f'attachment; filename="{session_name}.json"')
-                    self.end_headers()
-                    with open(session_file_path, 'rb') as f:
-                        self.wfile.write(f.read())
-                    logger.info(f"📁 Exported session file: {session_name}.json")
-                    return
-                else:
-                    self.send_response(404)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({'error': 'Session file not found'}).encode())
-                    return
-            except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(e)}).encode())
-                logger.error(f"Error exporting session: {e}")
-                return
-        if self.path == '/api/rubric':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            rubric_path = os.path.join(os.path.dirname(__file__), '..', 'rubric.md')
-            try:
-                with open(rubric_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                response = {'content': content}
-            except FileNotFoundError:
-                response = {'content': '# Assessment Rubric\n\nNo rubric file found. Create your rubric here.'}
-            except Exception as e:
-                response = {'content': f'Error reading rubric: {str(e)}'}
-            self.wfile.write(json.dumps(response).encode())
-            return
-        # Return assembled column stacks for a chunk (useful for client-side meshing)
-        if self.path.startswith('/api/chunk-stacks/'):
-            try:
-                parts = self.path[len('/api/chunk-stacks/'):].split('/')
-                if len(parts) != 3:
-                    raise ValueError('expected /api/chunk-stacks/<dim>/<x>/<z>')
-                dim = parts[0]
-                x = int(parts[1])
-                z = int(parts[2])
-                stacks = chunk_store.assemble_chunk_column_stacks(dim, x, z)
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'stacks': stacks}).encode())
-            except Exception as e:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(e)}).encode())
-            return
-        if self.path == '/api/download-assessment':
-            try:
-                if not state.latest_assessment_results.get('analyses'):
-                    self.send_response(404)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({'error': 'No assessment results available'}).encode())
-                    return
-                from docx import Document
-                doc = Document()
-                # Minimal fallback document
-                doc.add_heading('Assessment', 0)
-                from io import BytesIO
-                bio = BytesIO()
-                doc.save(bio)
-                bio.seek(0)
-                doc_bytes = bio.read()
-                timestamp = 'now'
-                filename = f'minecraft_assessment_{timestamp}.docx'
-                self.send_response(200)
-                self.send_header('Content-type', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-                self.send_header('Content-Length', str(len(doc_bytes)))
-                self.end_headers()
-                self.wfile.write(doc_bytes)
-                logger.info(f"📄 Generated assessment document: {filename}")
-            except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(e)}).encode())
-                logger.error(f"Error generating assessment document: {e}")
-            return
-        # static file serving
-        clean_path = self.path.split('?')[0]
-        if '..' in clean_path:
-            self.send_response(403)
-            self.end_headers()
-            return
-        content_types = {'.html': 'text/html', '.css': 'text/css', '.js': 'application/javascript', '.json': 'application/json'}
-        file_ext = os.path.splitext(clean_path)[1]
-        content_type = content_types.get(file_ext, 'text/plain')
-        file_path = os.path.join(static_dir, clean_path.lstrip('/'))
-        try:
-            with open(file_path, 'rb') as f:
-                content = f.read()
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
-            self.end_headers()
-            self.wfile.write(content)
-        except FileNotFoundError:
-            self.send_response(404)
-            self.end_headers()
-            self.wfile.write(b'File not found')
-
-    def do_POST(self):
-        if self.path == '/api/rubric':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            try:
-                data = json.loads(post_data.decode('utf-8'))
-                content = data.get('content', '')
-                rubric_path = os.path.join(os.path.dirname(__file__), '..', 'rubric.md')
-                if os.path.exists(rubric_path):
-                    backup_path = rubric_path + '.backup'
-                    with open(rubric_path, 'r', encoding='utf-8') as f:
-                        backup_content = f.read()
-                    with open(backup_path, 'w', encoding='utf-8') as f:
-                        f.write(backup_content)
-                with open(rubric_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'success': True}).encode())
-                logger.info("📝 Rubric updated successfully")
-            except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(e)}).encode())
-                logger.error(f"Error saving rubric: {e})")
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def log_message(self, format, *args):
-        pass
-
-
-def run_http_server():
-    server = HTTPServer(('0.0.0.0', 8080), SimpleHTTPHandler)
-    logger.info("🌐 Web interface running at http://localhost:8080")
-    server.serve_forever()
+
+async def server_info(request):
+    # Use the external IP from environment or server detection
+    external_ip = utils.get_external_ip()
+    info = {
+        'external_ip': external_ip,
+        'minecraft_port': int(os.getenv('MINECRAFT_PORT', '19131')),
+        'ws_port': int(os.getenv('WS_PORT', '8081')),
+        'connection_string': f'/connect {external_ip}:{os.getenv("MINECRAFT_PORT", "19131")}'
+    }
+    return web.json_response(info)
+
+
+async def export_session(request):
+    session_name = request.match_info['name']
+    session_file_path = os.path.join(state.DATA_DIR, f"{session_name}.json")
+    try:
+        if session_name == state.session_id and state.session_fp is not None:
+            # The running session lives in its NDJSON log; materialize the JSON view first
+            await flush_events()
+            await write_session_json()
+        if os.path.exists(session_file_path):
+            logger.info(f"📁 Exported session file: {session_name}.json")
+            return web.FileResponse(session_file_path, headers={
+                'Content-Type': 'application/json',
+                'Content-Disposition': f'attachment; filename="{session_name}.json"'
+            })
+        return web.json_response({'error': 'Session file not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Error exporting session: {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def get_rubric(request):
+    try:
+        # Served from the in-memory copy; the file is only re-read after it changes
+        return web.Response(body=utils.get_rubric_json(), content_type='application/json')
+    except FileNotFoundError:
+        response = {'content': '# Assessment Rubric\n\nNo rubric file found. Create your rubric here.'}
+    except Exception as e:
+        response = {'content': f'Error reading rubric: {str(e)}'}
+    return web.json_response(response)
+
+
+async def save_rubric(request):
+    try:
+        data = json.loads(await request.text())
+        utils.save_rubric(data.get('content', ''))
+        logger.info("📝 Rubric updated successfully")
+        return web.json_response({'success': True})
+    except Exception as e:
+        logger.error(f"Error saving rubric: {e})")
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def chunk_stacks(request):
+    """Return assembled column stacks for a chunk (useful for client-side meshing)"""
+    try:
+        dim = request.match_info['dim']
+        x = int(request.match_info['x'])
+        z = int(request.match_info['z'])
+        stacks = chunk_store.assemble_chunk_column_stacks(dim, x, z)
+        return web.json_response({'stacks': stacks})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=400)
+
+
+async def download_assessment(request):
+    try:
+        if not state.latest_assessment_results.get('analyses'):
+            return web.json_response({'error': 'No assessment results available'}, status=404)
+        from docx import Document
+        doc = Document()
+        # Minimal fallback document
+        doc.add_heading('Assessment', 0)
+        from io import BytesIO
+        bio = BytesIO()
+        doc.save(bio)
+        bio.seek(0)
+        doc_bytes = bio.read()
+        timestamp = 'now'
+        filename = f'minecraft_assessment_{timestamp}.docx'
+        logger.info(f"📄 Generated assessment document: {filename}")
+        return web.Response(body=doc_bytes, headers={
+            'Content-Type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+    except Exception as e:
+        logger.error(f"Error generating assessment document: {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+
+# url path -> cached static file; built once at startup by build_static_table()
+_STATIC = {}
+_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Larger binary assets are not held in memory; aiohttp streams them with sendfile()
+_SENDFILE_MIN_SIZE = 256 * 1024
+
+
+def _load_static_entry(file_path):
+    content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    st = os.stat(file_path)
+    if st.st_size >= _SENDFILE_MIN_SIZE and not content_type.startswith(_COMPRESSIBLE_TYPES):
+        return {'path': file_path, 'mtime': st.st_mtime_ns, 'body': None, 'gzip': None,
+                'content_type': content_type, 'charset': None}
+    with open(file_path, 'rb') as f:
+        body = f.read()
+    compressed = None
+    if content_type.startswith(_COMPRESSIBLE_TYPES) and len(body) > 1024:
+        compressed = gzip.compress(body, compresslevel=6)
+    return {
+        'path': file_path,
+        'mtime': st.st_mtime_ns,
+        'body': body,
+        'gzip': compressed,
+        'content_type': content_type,
+        'charset': 'utf-8' if content_type.startswith(_COMPRESSIBLE_TYPES) else None,
+    }
+
+
+def build_static_table():
+    """Read every file under static/ into memory, keyed by its URL path."""
+    _STATIC.clear()
+    for root, _, files in os.walk(STATIC_DIR):
+        for name in files:
+            file_path = os.path.join(root, name)
+            url = '/' + os.path.relpath(file_path, STATIC_DIR).replace(os.sep, '/')
+            _STATIC[url] = _load_static_entry(file_path)
+    if '/index.html' in _STATIC:
+        _STATIC['/'] = _STATIC['/index.html']
+    logger.info("📂 Cached %d static files", len(_STATIC))
+
+
+async def static_file(request):
+    clean_path = request.path
+    if '..' in clean_path:
+        return web.Response(status=403)
+    entry = _STATIC.get(clean_path)
+    if entry is None:
+        return web.Response(status=404, text='File not found')
+    try:
+        # Pick up edits without a restart; a stat is far cheaper than re-reading the file
+        if os.stat(entry['path']).st_mtime_ns != entry['mtime']:
+            entry.update(_load_static_entry(entry['path']))
+    except FileNotFoundError:
+        return web.Response(status=404, text='File not found')
+    if entry['body'] is None:
+        return web.FileResponse(entry['path'])
+    if entry['gzip'] is not None and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        return web.Response(body=entry['gzip'], content_type=entry['content_type'], charset=entry['charset'],
+                            headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+    return web.Response(body=entry['body'], content_type=entry['content_type'], charset=entry['charset'])
+
+
+def create_app():
+    build_static_table()
+    app = web.Application()
+    app.router.add_get('/api/server-info', server_info)
+    app.router.add_get('/api/export-session/{name}', export_session)
+    app.router.add_get('/api/rubric', get_rubric)
+    app.router.add_post('/api/rubric', save_rubric)
+    app.router.add_get('/api/chunk-stacks/{dim}/{x}/{z}', chunk_stacks)
+    app.router.add_get('/api/download-assessment', download_assessment)
+    app.router.add_get('/{tail:.*}', static_file)
+    return app
+
+
+async def start_http_server():
+    """Start the HTTP server on the running event loop and return its runner for cleanup."""
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    port = int(os.getenv('HTTP_PORT', '8080'))
+    site = web.TCPSite(runner, '0.0.0.0', port)
+    await site.start()
+    logger.info(f"🌐 Web interface running at http://localhost:{port}")
+    return runner
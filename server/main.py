@@ -1,16 +1,17 @@
 """Entrypoint that wires up servers previously in app.py"""
 import asyncio
 import logging
-import threading
 import os
 import signal
 import sys
+from . import state
 from .state import ensure_data_directory
-from .http import run_http_server
-from .minecraft_ws import handle_minecraft_client
+from .session import event_writer, flush_events_blocking, end_session_blocking
+from .http import start_http_server
+from .utils import get_external_ip
+from .minecraft_ws import handle_minecraft_client, save_notifier, position_broadcaster
 from .web_ws import handle_web_client
 import websockets
-import socket
 from .chunk_cache import ChunkCache
 from .chunk_processor import ChunkProcessor
 from .optimized_renderer import OptimizedRenderer
@@ -18,25 +19,39 @@ from .chunk_storage import ChunkStorage
 
 logger = logging.getLogger(__name__)
 
-# Global shutdown event
-shutdown_event = asyncio.Event()
+# Global shutdown event, created by main() on the running loop: before Python 3.10 an asyncio.Event
+# binds to the loop current at construction, which at import time is not the one asyncio.run starts
+shutdown_event = None
 
 
-def signal_handler(signum, frame):
-    """Handle shutdown signals"""
+def request_shutdown(signum):
+    """Handle shutdown signals; runs on the event loop so main() can finish its cleanup"""
     logger.info(f"🛑 Received signal {signum}, initiating graceful shutdown...")
-    shutdown_event.set()
+    if shutdown_event is not None:
+        shutdown_event.set()
+
+
+def install_signal_handlers(loop):
+    """Route SIGINT/SIGTERM (and SIGBREAK on Windows) to request_shutdown on the loop."""
+    signals = [signal.SIGINT, signal.SIGTERM]
+    if sys.platform == "win32":
+        signals.append(signal.SIGBREAK)
+    for sig in signals:
+        try:
+            loop.add_signal_handler(sig, request_shutdown, sig)
+        except NotImplementedError:
+            # Windows event loops have no add_signal_handler; hop onto the loop from the C handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(request_shutdown, signum))
 
 
 async def main():
     """Main server entry point with performance optimizations"""
+    global shutdown_event
     logger.info("Starting optimized Minecraft assessment server...")
+    shutdown_event = asyncio.Event()
     
     # Set up signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    if sys.platform == "win32":
-        signal.signal(signal.SIGBREAK, signal_handler)
+    install_signal_handlers(asyncio.get_running_loop())
     
     # Initialize performance components with GPU support
     chunk_storage = ChunkStorage()
@@ -46,17 +61,19 @@ async def main():
     available_memory_gb = psutil.virtual_memory().available / (1024**3)
     cache_size = min(10000, int(2000 + available_memory_gb * 500))  # Scale with memory
     
-    chunk_cache = ChunkCache(max_size=cache_size, compression_level=6, storage=chunk_storage)
+    chunk_cache = ChunkCache(max_size=cache_size, compression_level=6, storage=chunk_storage,
+                             dict_path=os.getenv('CHUNK_ZSTD_DICT'))
     
     # Increase batch size for better GPU utilization
     batch_size = 100 if os.environ.get('CUDA_VISIBLE_DEVICES') is not None else 10
-    chunk_processor = ChunkProcessor(batch_size=batch_size)
+    chunk_processor = ChunkProcessor(batch_size=batch_size,
+                                     max_batch_wait_ms=float(os.getenv('CHUNK_BATCH_WAIT_MS', '5')))
     
     renderer = OptimizedRenderer(chunk_cache, chunk_processor)
     
     # Log system capabilities
     logger.info(f"💻 System: {psutil.cpu_count()} CPUs, {available_memory_gb:.1f} GB available RAM")
-    logger.info(f"📦 Cache size: {cache_size} chunks")
+    logger.info(f"📦 Cache size: {cache_size} chunks ({chunk_cache.codec} compression)")
     if hasattr(chunk_processor, 'GPU_AVAILABLE') and chunk_processor.GPU_AVAILABLE:
         logger.info("🎮 GPU acceleration enabled")
     else:
@@ -70,8 +87,12 @@ async def main():
     web_ws.handle_web_client.renderer = renderer
     
     # Keep track of servers for cleanup
+    http_runner = None
     minecraft_server = None
     web_server = None
+    event_writer_task = asyncio.create_task(event_writer())
+    save_notifier_task = asyncio.create_task(save_notifier())
+    position_task = asyncio.create_task(position_broadcaster())
     
     try:
         logger.info('=' * 60)
@@ -85,8 +106,7 @@ async def main():
             logger.info(f"📊 Loaded {map_bounds['total_chunks']} chunks from storage")
             logger.info(f"🗺️  Map bounds: {map_bounds['min']} to {map_bounds['max']}")
         
-        http_thread = threading.Thread(target=run_http_server, daemon=True)
-        http_thread.start()
+        http_runner = await start_http_server()
         minecraft_server = await websockets.serve(handle_minecraft_client, '0.0.0.0', int(os.getenv('MINECRAFT_PORT', '19131')))
         web_server = await websockets.serve(handle_web_client, '0.0.0.0', int(os.getenv('WS_PORT', '8081')))
         logger.info('✅ Servers started successfully!')
@@ -95,19 +115,6 @@ async def main():
         await renderer.start_background_loader()
         
         # Resolve an external IP or hostname to show to users — prefer explicit env var if provided
-        def get_external_ip():
-            # Allow override
-            env_ip = os.getenv('EXTERNAL_IP') or os.getenv('SERVER_HOST')
-            if env_ip:
-                return env_ip
-            try:
-                # Use UDP trick to determine outbound IP on machines with network access
-                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                    s.connect(("8.8.8.8", 80))
-                    return s.getsockname()[0]
-            except Exception:
-                return 'localhost'
-
         external_ip = get_external_ip()
         logger.info(f"📡 Minecraft: Connect with /connect {external_ip}:{os.getenv('MINECRAFT_PORT', '19131')}")
         logger.info(f"🌐 3D Viewer: Open http://{external_ip}:{os.getenv('HTTP_PORT', '8080')} in your browser")
@@ -132,6 +139,10 @@ async def main():
     finally:
         logger.info("🧹 Cleaning up resources...")
         
+        if http_runner:
+            logger.info("  • Closing HTTP server...")
+            await http_runner.cleanup()
+        
         # Close websocket servers
         if minecraft_server:
             logger.info("  • Closing Minecraft WebSocket server...")
@@ -143,6 +154,17 @@ async def main():
             web_server.close()
             await web_server.wait_closed()
         
+        # Stop the session writer and persist anything still queued
+        position_task.cancel()
+        save_notifier_task.cancel()
+        event_writer_task.cancel()
+        await asyncio.gather(position_task, save_notifier_task, event_writer_task, return_exceptions=True)
+        flush_events_blocking()
+        # Closing the Minecraft server ends the session when the last player leaves; this covers a
+        # session whose log is still open because no player ever joined it
+        if state.session_fp is not None:
+            end_session_blocking()
+        
         # Save final metadata
         logger.info("  • Saving chunk metadata...")
         await chunk_storage.save_metadata()
@@ -161,50 +183,24 @@ async def main():
         logger.info("✅ Server shutdown complete")
 
 
-async def handle_websocket_with_http_check(websocket, path):
-    """WebSocket handler with HTTP request detection"""
-    try:
-        # The actual WebSocket handling will happen here
-        # since websockets library already validated the upgrade
-        await websocket_handler(websocket, path)
-    except Exception as e:
-        logger.error(f"WebSocket error: {e}")
+def run():
+    """Run main() on uvloop when it is installed; Windows has no uvloop and uses the stdlib loop.
 
-async def websocket_handler(websocket, path):
-    """Original WebSocket handler logic"""
-    # ...existing websocket handling code...
+    Set USE_UVLOOP=false to force the stdlib loop, e.g. when comparing or debugging.
+    """
+    uvloop = None
+    if os.getenv('USE_UVLOOP', 'true').lower() in ('1', 'true', 'yes'):
+        try:
+            import uvloop
+        except ImportError:
+            pass
+    if uvloop is None:
+        logger.info("Using the default asyncio event loop")
+        asyncio.run(main())
+    else:
+        logger.info("⚡ Using uvloop event loop")
+        uvloop.run(main())
 
-async def start_websocket_server():
-    """Start the WebSocket server with proper error handling"""
-    try:
-        # Add process_request to handle HTTP requests gracefully
-        async def process_request(path, request_headers):
-            # Check if this is a regular HTTP request (missing Upgrade header)
-            if "Upgrade" not in request_headers or request_headers["Upgrade"].lower() != "websocket":
-                # Return HTTP response for non-WebSocket requests
-                return (
-                    http.HTTPStatus.BAD_REQUEST,
-                    [("Content-Type", "text/plain")],
-                    b"This is a WebSocket endpoint. Please use a WebSocket client to connect.\n"
-                    b"For the web interface, use port 8080 instead."
-                )
-            # Return None to continue with WebSocket handshake
-            return None
-        
-        server = await websockets.serve(
-            handle_websocket_with_http_check,
-            "0.0.0.0",
-            8081,
-            process_request=process_request,
-            # Increase limits for game data
-            max_size=10 * 1024 * 1024,  # 10MB
-            max_queue=1000
-        )
-        logger.info("WebSocket server listening on 0.0.0.0:8081")
-        return server
-    except Exception as e:
-        logger.error(f"Failed to start WebSocket server: {e}")
-        raise
 
 if __name__ == '__main__':
     try:
@@ -219,7 +215,7 @@ if __name__ == '__main__':
         level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
         logging.basicConfig(level=level, format='%(asctime)s - %(message)s')
     try:
-        asyncio.run(main())
+        run()
     except KeyboardInterrupt:
         # This is handled by our signal handler
         pass
@@ -1,27 +1,105 @@
 """Minecraft WebSocket handler moved from app.py"""
+import asyncio
 import json
 import logging
 import math
+import orjson
 import time
 import os
-from uuid import uuid4
 import websockets
 from . import state
-from .session import start_session, record_event, end_session
-from .utils import broadcast_to_web
+from .session import start_session, record_event, end_session, PlayerEvent
+from .utils import broadcast_to_web, next_request_id, msgpack, MSGPACK_AVAILABLE
 from . import chunk_store
 
 logger = logging.getLogger(__name__)
 
+# Events with dedicated handlers that update the live view as well as the session record
+BROADCAST_EVENTS = ("BlockPlaced","BlockBroken","PlayerTravelled","PlayerMessage")
+# Gameplay events that are only written to the session record
+RECORD_ONLY_EVENTS = ("ItemUsed","ItemInteracted","ItemCrafted","ItemSmelted","ItemEquipped","ItemDropped","ItemPickedUp","PlayerDied","MobKilled","PlayerHurt","PlayerAttack","DoorUsed","ChestOpened","ContainerClosed","ButtonPressed","LeverUsed","PressurePlateActivated","PlayerJump","PlayerSneak","PlayerSprint","PlayerSwim","PlayerClimb","PlayerGlide","PlayerTeleport","AwardAchievement","PlayerTransform","EntityInteracted","PlayerEat","PlayerSleep","PlayerWake","CameraUsed","BookEdited","BossKilled","RaidCompleted","TradeCompleted")
+# World-state events nothing downstream reads; subscribed only when RECORD_ALL_EVENTS is enabled
+WORLD_EVENTS = ("EntitySpawned","EntityRemoved","WeatherChanged","TimeChanged","GameRulesUpdated")
+RECORD_ALL_EVENTS = os.getenv('RECORD_ALL_EVENTS', 'false').lower() in ('1', 'true', 'yes')
+EVENTS_TO_SUBSCRIBE = BROADCAST_EVENTS + RECORD_ONLY_EVENTS + (WORLD_EVENTS if RECORD_ALL_EVENTS else ())
+
+# Recorded event_type for each subscribed event name, computed once instead of per event
+_EVENT_TYPES = {name: name.lower() for name in EVENTS_TO_SUBSCRIBE}
+# Events handled by their own branch that the generic recorder must skip
+_SKIP_GENERIC = frozenset({'PlayerTravelled'})
+# Shared fallback for missing sub-objects; only ever read with .get(), never mutated
+_EMPTY_DICT = {}
+
+
+def _block_key(x, y, z):
+    """Pack the block a position falls in into one int; floor, not int(), so -0.5 and 0.5 are different blocks."""
+    return ((math.floor(x) & 0x3FFFFFF) << 38) | ((math.floor(z) & 0x3FFFFFF) << 12) | (math.floor(y) & 0xFFF)
+
+
+def _command_template(message):
+    """Serialize a command once, leaving a %s slot where each send's requestId goes."""
+    return json.dumps(message).replace('%', '%%').replace('"__REQUEST_ID__"', '"%s"')
+
+
+# Connect-time commands are constant apart from the requestId, so they are serialized at import
+_SUBSCRIBE_TEMPLATES = {
+    name: _command_template({'header': {'version': 1, 'requestId': '__REQUEST_ID__', 'messageType': 'commandRequest', 'messagePurpose': 'subscribe'}, 'body': {'eventName': name}})
+    for name in EVENTS_TO_SUBSCRIBE
+}
+_WELCOME_TEMPLATE = _command_template({
+    'header': {'version':1,'requestId':'__REQUEST_ID__','messageType':'commandRequest','messagePurpose':'commandRequest'},
+    'body': {'origin':{'type':'player'}, 'commandLine': 'tellraw @a {"rawtext":[{"text":"§6§l======\\n§r§e§lWelcome to Playtrace AI\n§r§eYour game data is being recorded.\n§eIf you do not want this please exit now.\n§6§l======"}]}}', 'version':1}
+})
+
+
 async def send_welcome_message(websocket):
-    welcome_command = {
-        'header': {'version':1,'requestId':str(uuid4()),'messageType':'commandRequest','messagePurpose':'commandRequest'},
-        'body': {'origin':{'type':'player'}, 'commandLine': 'tellraw @a {"rawtext":[{"text":"§6§l======\\n§r§e§lWelcome to Playtrace AI\n§r§eYour game data is being recorded.\n§eIf you do not want this please exit now.\n§6§l======"}]}}', 'version':1}
-    }
-    await websocket.send(json.dumps(welcome_command))
+    await websocket.send(_WELCOME_TEMPLATE % next_request_id())
     logger.info('📢 Sent welcome message')
 
 
+async def _handle_block_event(body, player_pos, player_id, player_name, event_kind, y_offset, ws_type, emoji):
+    """Record and broadcast a BlockPlaced/BlockBroken event; the block is estimated from the player position."""
+    px, py, pz = player_pos.get('x', 0), player_pos.get('y', 0), player_pos.get('z', 0)
+    block_x, block_y, block_z = int(px), int(py), int(pz)
+    block_info = body.get('block') or _EMPTY_DICT
+    block_type = f"{block_info.get('namespace', 'minecraft')}:{block_info.get('id', 'unknown')}"
+    block_pos = {'x': block_x, 'y': block_y + y_offset, 'z': block_z}
+    record_event(event_kind, PlayerEvent(player_id, player_name, px, py, pz, extra={'block_type': block_type, 'estimated_block_position': block_pos}, position_field='player_position'))
+    await broadcast_to_web({'type': ws_type, 'x': px, 'y': py, 'z': pz, 'blockPos': block_pos, 'blockType': block_type, 'playerName': player_name or 'Unknown'})
+    logger.debug("%s Block %s: %s near (%d, %d, %d) by %s", emoji, event_kind.split('_', 1)[1], block_type, block_x, block_y, block_z, player_name)
+
+
+def _decode_frame(message):
+    """Minecraft sends JSON text frames; binary frames (e.g. from a relay) may carry the same message as msgpack."""
+    if isinstance(message, str) or not MSGPACK_AVAILABLE:
+        return orjson.loads(message)
+    return msgpack.unpackb(message, raw=False)
+
+
+async def save_notifier(interval=5):
+    """Tell web clients about unsaved events on a timer rather than checking on every message."""
+    while True:
+        await asyncio.sleep(interval)
+        if state.unsaved_events:
+            try:
+                await broadcast_to_web({'type': 'save_notification'})
+            except Exception:
+                logger.exception('failed to broadcast save notification')
+
+
+async def position_broadcaster(interval=0.05):
+    """Send one 'positions' snapshot per tick (20 Hz) covering the players who moved, instead of a message per move."""
+    while True:
+        await asyncio.sleep(interval)
+        moved = state.player_positions.dirty
+        if moved:
+            state.player_positions.dirty = set()
+            try:
+                await broadcast_to_web({'type': 'positions', 'players': state.player_positions.snapshot(moved)})
+            except Exception:
+                logger.exception('failed to broadcast player positions')
+
+
 async def handle_minecraft_client(websocket):
     """Handle Minecraft client connections"""
     # Use state.active_players from the shared state module
@@ -35,23 +113,22 @@ async def handle_minecraft_client(websocket):
     player_name = None
     welcome_sent = False
     if len(state.active_players) == 0:
-        start_session()
+        await start_session()
         # Prepare session info safely
         start_time_iso = state.session_start_time.isoformat() if state.session_start_time else None
         file_name = os.path.basename(state.session_file) if state.session_file else None
         await broadcast_to_web({'type':'session_info','sessionId': state.session_id, 'startTime': start_time_iso, 'fileName': file_name})
     try:
         await websocket.send(json.dumps({'header':{'messagePurpose':'commandResponse'}, 'body':{'statusMessage': f"Connected to Playtrace AI! Session: {os.path.basename(state.session_file) if state.session_file else 'N/A'}"}}))
-        events_to_subscribe = ["BlockPlaced","BlockBroken","PlayerTravelled","PlayerMessage","ItemUsed","ItemInteracted","ItemCrafted","ItemSmelted","ItemEquipped","ItemDropped","ItemPickedUp","PlayerDied","MobKilled","PlayerHurt","PlayerAttack","DoorUsed","ChestOpened","ContainerClosed","ButtonPressed","LeverUsed","PressurePlateActivated","PlayerJump","PlayerSneak","PlayerSprint","PlayerSwim","PlayerClimb","PlayerGlide","PlayerTeleport","AwardAchievement","PlayerTransform","EntitySpawned","EntityRemoved","EntityInteracted","WeatherChanged","TimeChanged","GameRulesUpdated","PlayerEat","PlayerSleep","PlayerWake","CameraUsed","BookEdited","BossKilled","RaidCompleted","TradeCompleted"]
+        for event_name in EVENTS_TO_SUBSCRIBE:
+            await websocket.send(_SUBSCRIBE_TEMPLATES[event_name] % next_request_id())
+        logger.info(f"📋 Subscribed to {len(EVENTS_TO_SUBSCRIBE)} event types")
 
-        for event_name in events_to_subscribe:
-            await websocket.send(json.dumps({'header':{'version':1,'requestId':str(uuid4()),'messageType':'commandRequest','messagePurpose':'subscribe'}, 'body':{'eventName':event_name}}))
-        logger.info(f"📋 Subscribed to {len(events_to_subscribe)} event types")
-
-        position_update_counter = 0
+        # player_id -> packed block coordinates of the last recorded position
+        last_block_keys = {}
         async for message in websocket:
             try:
-                msg = json.loads(message)
+                msg = _decode_frame(message)
                 header = msg.get('header', {})
                 body = msg.get('body', {})
                 event_name = header.get('eventName', '')
@@ -75,7 +152,7 @@ async def handle_minecraft_client(websocket):
                                     'requestId': rec.get('request_id'),
                                     'timestamp': rec.get('timestamp')
                                 })
-                                logger.info(f"📦 Broadcasted chunk {rec.get('dimension')} {rec.get('x')} {rec.get('z')} y={rec.get('y')}")
+                                logger.debug("📦 Broadcasted chunk %s %s %s y=%s", rec.get('dimension'), rec.get('x'), rec.get('z'), rec.get('y'))
                             except Exception:
                                 logger.exception('failed to broadcast chunk to web clients')
                 except Exception:
@@ -90,113 +167,93 @@ async def handle_minecraft_client(websocket):
                     if not welcome_sent:
                         await send_welcome_message(websocket)
                         welcome_sent = True
-                    record_event('player_join', {'player_id': player_id, 'player_name': player_name, 'address': client_addr})
+                    record_event('player_join', PlayerEvent(player_id, player_name, extra={'address': client_addr}))
                     try:
                         if 'position' in player_data:
                             pos = player_data['position']
                             pos_x = float(pos.get('x', 0))
                             pos_y = float(pos.get('y', 0))
                             pos_z = float(pos.get('z', 0))
-                            state.player_positions[player_id] = {'x': pos_x, 'y': pos_y, 'z': pos_z, 'name': player_name}
+                            state.player_positions.set_position(player_id, player_name, pos_x, pos_y, pos_z)
                             await broadcast_to_web({'type': 'position', 'playerId': player_id, 'playerName': player_name, 'x': pos_x, 'y': pos_y, 'z': pos_z})
                         # Always send authoritative snapshot so web clients have the canonical list
                         await broadcast_active_players()
                     except Exception:
                         logger.exception('failed to broadcast initial player info')
                 if header.get('messagePurpose') == 'event':
-                    player_data = body.get('player', {})
+                    player_data = body.get('player') or _EMPTY_DICT
+                    player_pos = player_data.get('position') or _EMPTY_DICT
                     current_player_id = str(player_data.get('id', player_id)) if player_data else player_id
                     current_player_name = player_data.get('name', player_name) if player_data else player_name
                     if event_name == 'PlayerMessage':
                         message_type = body.get('type', '')
                         message_text = body.get('message', '')
                         sender = body.get('sender', 'Unknown')
-                        record_event('player_chat', {'player_id': current_player_id, 'player_name': current_player_name, 'message': message_text, 'message_type': message_type, 'sender': sender})
+                        record_event('player_chat', PlayerEvent(current_player_id, current_player_name, extra={'message': message_text, 'message_type': message_type, 'sender': sender}))
                         await broadcast_to_web({'type': 'player_chat', 'playerId': current_player_id, 'playerName': current_player_name, 'message': message_text})
-                        logger.info(f"💬 Chat from {current_player_name}: {message_text}")
+                        logger.debug("💬 Chat from %s: %s", current_player_name, message_text)
                     elif event_name == 'PlayerTravelled':
-                        if 'position' in player_data:
-                            pos = player_data['position']
-                            pos_x = float(pos['x'])
-                            pos_y = float(pos['y'])
-                            pos_z = float(pos['z'])
-                            state.player_positions[current_player_id] = {'x': pos_x, 'y': pos_y, 'z': pos_z, 'name': current_player_name}
-                            position_update_counter += 1
-                            if (position_update_counter % 10) == 0:
-                                record_event('player_position', {'player_id': current_player_id, 'player_name': current_player_name, 'position': {'x': pos_x, 'y': pos_y, 'z': pos_z}, 'dimension': player_data.get('dimension', 'overworld')})
-                        await broadcast_to_web({'type': 'position', 'playerId': current_player_id, 'playerName': current_player_name, 'x': pos_x, 'y': pos_y, 'z': pos_z})
-                        # Request chunk data for the player's current chunk (and y slice)
-                        try:
-                            chunk_x = int(math.floor(pos_x / 16.0))
-                            chunk_z = int(math.floor(pos_z / 16.0))
+                        if player_pos:
+                            # JSON numbers already decode to int/float, so no casts are needed
+                            pos_x, pos_y, pos_z = player_pos['x'], player_pos['y'], player_pos['z']
+                            # Stored only; position_broadcaster sends all moved players once per tick
+                            state.player_positions.set_position(current_player_id, current_player_name, pos_x, pos_y, pos_z)
                             dim = player_data.get('dimension', 'overworld')
-                            # Use player's Y as the requested slice and centralize
-                            # presence/request logic in chunk_store.ensure_chunk_present.
-                            y_slice = int(pos_y)
-                            await chunk_store.ensure_chunk_present(websocket, dim, chunk_x, chunk_z, y=y_slice, radius=1)
-                        except Exception:
-                            logger.exception('failed to request chunk for player position')
+                            # Record only when the player enters a new block; live updates still use the floats
+                            block_key = _block_key(pos_x, pos_y, pos_z)
+                            if block_key != last_block_keys.get(current_player_id):
+                                last_block_keys[current_player_id] = block_key
+                                record_event('player_position', PlayerEvent(current_player_id, current_player_name, pos_x, pos_y, pos_z, extra={'dimension': dim}))
+                            # Request chunk data for the player's current chunk (and y slice)
+                            try:
+                                chunk_x = int(math.floor(pos_x / 16.0))
+                                chunk_z = int(math.floor(pos_z / 16.0))
+                                # Use player's Y as the requested slice and centralize
+                                # presence/request logic in chunk_store.ensure_chunk_present.
+                                y_slice = int(pos_y)
+                                await chunk_store.ensure_chunk_present(websocket, dim, chunk_x, chunk_z, y=y_slice, radius=1)
+                            except Exception:
+                                logger.exception('failed to request chunk for player position')
                     elif event_name == 'BlockPlaced':
-                        player_pos = body.get('player', {}).get('position', {})
-                        block_x = int(player_pos.get('x', 0))
-                        block_y = int(player_pos.get('y', 0))
-                        block_z = int(player_pos.get('z', 0))
-                        block_info = body.get('block', {})
-                        block_id = block_info.get('id', 'unknown')
-                        block_namespace = block_info.get('namespace', 'minecraft')
-                        block_type = f"{block_namespace}:{block_id}"
-                        record_event('block_placed', {'player_id': player_id, 'player_name': player_name, 'block_type': block_type, 'player_position': {'x': player_pos.get('x', 0), 'y': player_pos.get('y', 0), 'z': player_pos.get('z', 0)}, 'estimated_block_position': {'x': block_x, 'y': block_y + 1, 'z': block_z}})
-                        await broadcast_to_web({'type': 'block_place', 'x': player_pos.get('x', 0), 'y': player_pos.get('y', 0), 'z': player_pos.get('z', 0), 'blockPos': {'x': block_x, 'y': block_y + 1, 'z': block_z}, 'blockType': block_type, 'playerName': player_name or 'Unknown'})
-                        logger.info(f"🟩 Block placed: {block_type} near ({block_x}, {block_y}, {block_z}) by {player_name}")
+                        await _handle_block_event(body, player_pos, player_id, player_name, 'block_placed', 1, 'block_place', '🟩')
                     elif event_name == 'BlockBroken':
-                        player_pos = body.get('player', {}).get('position', {})
-                        block_x = int(player_pos.get('x', 0))
-                        block_y = int(player_pos.get('y', 0))
-                        block_z = int(player_pos.get('z', 0))
-                        block_info = body.get('block', {})
-                        block_id = block_info.get('id', 'unknown')
-                        block_namespace = block_info.get('namespace', 'minecraft')
-                        block_type = f"{block_namespace}:{block_id}"
-                        record_event('block_broken', {'player_id': player_id, 'player_name': player_name, 'block_type': block_type, 'player_position': {'x': player_pos.get('x', 0), 'y': player_pos.get('y', 0), 'z': player_pos.get('z', 0)}, 'estimated_block_position': {'x': block_x, 'y': block_y, 'z': block_z}})
-                        await broadcast_to_web({'type': 'block_break', 'x': player_pos.get('x', 0), 'y': player_pos.get('y', 0), 'z': player_pos.get('z', 0), 'blockPos': {'x': block_x, 'y': block_y, 'z': block_z}, 'blockType': block_type, 'playerName': player_name or 'Unknown'})
-                        logger.info(f"🟥 Block broken: {block_type} near ({block_x}, {block_y}, {block_z}) by {player_name}")
+                        await _handle_block_event(body, player_pos, player_id, player_name, 'block_broken', 0, 'block_break', '🟥')
                     else:
-                        if event_name and event_name not in ['PlayerTravelled']:
-                            record_event(event_name.lower(), {'player_id': current_player_id, 'player_name': current_player_name, 'event_data': body})
-                if len(state.event_buffer) > 0 and (time.time() - (state.last_save_time or 0) > 5):
-                    await broadcast_to_web({'type': 'save_notification'})
+                        if event_name and event_name not in _SKIP_GENERIC:
+                            record_event(_EVENT_TYPES.get(event_name) or event_name.lower(), PlayerEvent(current_player_id, current_player_name, extra={'event_data': body}))
             except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                logger.error(f"Message content: {message}")
+                logger.error("Error processing message: %s", e)
+                logger.error("Message content: %s", message)
     except websockets.exceptions.ConnectionClosed:
         logger.info(f"🎮 Minecraft disconnected: {player_name or 'Unknown'}")
     finally:
         if player_id:
-            record_event('player_leave', {'player_id': player_id, 'player_name': player_name})
-            if player_id in state.player_positions:
-                del state.player_positions[player_id]
-            if player_id in state.active_players:
-                state.active_players.remove(player_id)
-            await broadcast_to_web({'type':'disconnect','playerId': player_id})
+            # Persist first, with no await before the leave record is queued, so a cancellation here cannot lose it
+            record_event('player_leave', PlayerEvent(player_id, player_name))
+            state.player_positions.pop(player_id, None)
+            state.active_players.discard(player_id)
+            if len(state.active_players) == 0:
+                logger.info('📤 Last player left, ending session...')
+                # Shielded so a cancellation cannot interrupt the end record and the final JSON write
+                await asyncio.shield(end_session())
+            # Shielded so the web view still learns about the disconnect if this task is being cancelled
+            await asyncio.shield(broadcast_to_web({'type':'disconnect','playerId': player_id}))
             try:
                 # Also broadcast the updated authoritative active players list after a disconnect
-                await broadcast_active_players()
+                await asyncio.shield(broadcast_active_players())
             except Exception:
                 logger.exception('failed to broadcast active players list after disconnect')
-            if len(state.active_players) == 0:
-                logger.info('📤 Last player left, ending session...')
-                end_session()
 
 async def broadcast_active_players():
     try:
         players_list = []
         for pid in state.active_players:
-            pname = state.player_positions.get(pid, {}).get('name', pid)
-            entry = {'playerId': pid, 'playerName': pname}
             pos = state.player_positions.get(pid)
             if pos:
-                entry.update({'x': pos['x'], 'y': pos['y'], 'z': pos['z']})
-            players_list.append(entry)
+                pname, x, y, z = pos
+                players_list.append({'playerId': pid, 'playerName': pname, 'x': x, 'y': y, 'z': z})
+            else:
+                players_list.append({'playerId': pid, 'playerName': pid})
         await broadcast_to_web({'type': 'active_players', 'players': players_list})
     except Exception:
         logger.exception('broadcast_active_players failed')
@@ -1,173 +1,471 @@
 """Session management: start, save, end, and record events."""
 import os
-import json
+import re
 import time
+import orjson
+import numpy as np
 from datetime import datetime, timezone
 from . import state
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from .ai_client import analyze_prompt
+from .utils import get_rubric
 
 logger = logging.getLogger(__name__)
 
+# Numba is optional; it only speeds up path lengths for very long sessions
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    numba = None
+    NUMBA_AVAILABLE = False
 
-def start_session(user='juedwards'):
+
+class PlayerEvent:
+    """Flat per-player event payload, expanded into the nested dict layout only when serialized."""
+    __slots__ = ('player_id', 'player_name', 'x', 'y', 'z', 'position_field', 'extra')
+
+    def __init__(self, player_id, player_name, x=None, y=None, z=None, extra=None, position_field='position'):
+        self.player_id = player_id
+        self.player_name = player_name
+        self.x = x
+        self.y = y
+        self.z = z
+        self.position_field = position_field
+        self.extra = extra
+
+    def as_dict(self):
+        data = {'player_id': self.player_id, 'player_name': self.player_name}
+        if self.x is not None:
+            data[self.position_field] = {'x': self.x, 'y': self.y, 'z': self.z}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def _json_default(obj):
+    """orjson default hook rendering PlayerEvent payloads at write time."""
+    if isinstance(obj, PlayerEvent):
+        return obj.as_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+SESSION_LOG_BUFFER = 1 << 16
+# Group commit: fsync the session log every SYNC_BATCH events or SYNC_INTERVAL seconds
+SYNC_BATCH = 100
+SYNC_INTERVAL = 5.0
+_unsynced_events = 0
+_last_sync_time = 0.0
+
+# Single writer thread that owns session_fp: every log write, flush and fsync runs here,
+# in submission order, so the event loop never blocks on serialization or disk I/O
+_io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-io')
+
+
+async def _run_io(fn, *args):
+    """Run fn on the session writer thread, after any writes already queued, without blocking the loop."""
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, fn, *args)
+
+
+def _run_io_blocking(fn, *args):
+    """Blocking _run_io for final shutdown and tests, where nothing else needs the event loop."""
+    return _io_pool.submit(fn, *args).result()
+
+
+def _sync_session_log():
+    """Flush and fsync the session log (writer thread only)."""
+    global _unsynced_events, _last_sync_time
+    if state.session_fp is None:
+        return
+    save_session_realtime()
+    _unsynced_events = 0
+    _last_sync_time = time.time()
+    os.fsync(state.session_fp.fileno())
+
+
+def _close_session_log():
+    if state.session_fp is not None:
+        _sync_session_log()
+        state.session_fp.close()
+        state.session_fp = None
+
+
+def _append_to_log(event):
+    state.session_fp.write(orjson.dumps(event, default=_json_default, option=orjson.OPT_APPEND_NEWLINE))
+
+
+async def start_session(user='juedwards'):
     # Use the shared state module to set session attributes so all modules see updates
     state.session_start_time = state.now_utc()
     state.session_id = f"minecraft_session_{state.session_start_time.strftime('%Y%m%d_%H%M%S')}"
-    state.session_events = []
     initial_event = {
-        'timestamp': state.session_start_time.isoformat(),
+        'timestamp': state.session_start_time,
         'event_type': 'session_start',
         'data': {'session_id': state.session_id, 'server_version': '1.0', 'user': user}
     }
-    state.session_events.append(initial_event)
+    state.session_event_count = 1
     state.session_file = os.path.join(state.DATA_DIR, f"{state.session_id}.json")
-    save_session_realtime()
+    # Events are appended to an NDJSON log while the session runs; the JSON file is only
+    # materialized from it on export and when the session ends
+    await _run_io(_open_session_log, os.path.join(state.DATA_DIR, f"{state.session_id}.ndjson"), initial_event)
     logger.info(f"📝 Started new session: {state.session_id}")
 
 
+def _open_session_log(path, initial_event):
+    _close_session_log()
+    state.session_log_file = path
+    state.session_fp = open(path, 'wb', buffering=SESSION_LOG_BUFFER)
+    _append_to_log(initial_event)
+    save_session_realtime()
+
+
 def save_session_realtime():
-    if not state.session_file:
+    """Push buffered log lines to the OS; cost is proportional to the new events only."""
+    if state.session_fp is None:
+        return
+    state.session_fp.flush()
+    state.unsaved_events = 0
+    state.last_save_time = time.time()
+
+
+async def write_session_json(status=None):
+    """Stream the NDJSON log back into the session_info/events JSON file."""
+    await _run_io(_write_session_json, status)
+
+
+def _write_session_json(status=None):
+    if not state.session_file or not state.session_log_file:
         return
+    save_session_realtime()
     current_time = state.now_utc()
-    session_data = {
-        'session_info': {
-            'id': state.session_id,
-            'start_time': state.session_start_time.isoformat() if state.session_start_time else None,
-            'last_update': current_time.isoformat(),
-            'duration_seconds': (current_time - state.session_start_time).total_seconds() if state.session_start_time else 0,
-            'total_events': len(state.session_events),
-            'user': 'juedwards',
-            'status': 'active' if state.active_players else 'ended'
-        },
-        'events': state.session_events
+    session_info = {
+        'id': state.session_id,
+        'start_time': state.session_start_time,
+        'last_update': current_time,
+        'duration_seconds': (current_time - state.session_start_time).total_seconds() if state.session_start_time else 0,
+        'total_events': state.session_event_count,
+        'user': 'juedwards',
+        'status': status or ('active' if state.active_players else 'ended')
     }
     temp_file = f"{state.session_file}.tmp"
-    with open(temp_file, 'w', encoding='utf-8') as f:
-        json.dump(session_data, f, indent=2)
-    if os.path.exists(state.session_file):
-        os.remove(state.session_file)
-    os.rename(temp_file, state.session_file)
-    state.last_save_time = time.time()
+    # Only this one-off export is indented; the log lines are copied through unparsed
+    info = orjson.dumps(session_info, option=orjson.OPT_INDENT_2).replace(b'\n', b'\n  ')
+    with open(state.session_log_file, 'rb') as log, open(temp_file, 'wb') as f:
+        f.write(b'{\n  "session_info": ' + info + b',\n  "events": [')
+        first = True
+        for line in log:
+            line = line.strip()
+            if not line:
+                continue
+            f.write(b'\n    ' if first else b',\n    ')
+            f.write(line)
+            first = False
+        f.write(b'\n  ]\n}\n')
+    os.replace(temp_file, state.session_file)
 
 
-def end_session():
+async def end_session():
     if not state.session_id:
         return
-    session_end_time = state.now_utc()
-    state.session_events.append({
-        'timestamp': session_end_time.isoformat(),
+    # Queued events and the end record go to the writer as one job, so nothing lands after session_end
+    await _run_io(_end_session_log, _drain_event_queue(), state.now_utc())
+    logger.info(f"💾 Session ended and saved: {state.session_file} ({state.session_event_count} events)")
+
+
+def end_session_blocking():
+    """Blocking end_session for final shutdown and tests."""
+    if not state.session_id:
+        return
+    _run_io_blocking(_end_session_log, _drain_event_queue(), state.now_utc())
+    logger.info(f"💾 Session ended and saved: {state.session_file} ({state.session_event_count} events)")
+
+
+def _end_session_log(batch, session_end_time):
+    _write_events(batch)
+    end_event = {
+        'timestamp': session_end_time,
         'event_type': 'session_end',
         'data': {
             'session_id': state.session_id,
             'duration_seconds': (session_end_time - state.session_start_time).total_seconds() if state.session_start_time else 0,
-            'total_events': len(state.session_events)
+            'total_events': state.session_event_count
         }
-    })
-    save_session_realtime()
-    logger.info(f"💾 Session ended and saved: {state.session_file} ({len(state.session_events)} events)")
+    }
+    state.session_event_count += 1
+    if state.session_fp is not None:
+        _append_to_log(end_event)
+    _write_session_json(status='ended')
+    _close_session_log()
+
+
+EVENT_BATCH_SIZE = 256
 
 
 def record_event(event_type, data):
-    if state.session_id:
-        event = {'timestamp': state.now_utc().isoformat(), 'event_type': event_type, 'data': data}
-        state.session_events.append(event)
-        state.event_buffer.append(event)
-        current_time = time.time()
-        if (current_time - (state.last_save_time or 0) > 5) or (len(state.event_buffer) >= 50):
-            save_session_realtime()
-            state.event_buffer = []
-            state.last_save_time = current_time
-            logger.debug(f"💾 Auto-saved session with {len(state.session_events)} events")
+    """Queue an event for the session writer without blocking the caller."""
+    if not state.session_id:
+        return
+    item = (state.now_utc(), event_type, data)
+    queue = state.get_event_queue()
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        # Drop the oldest queued event rather than stalling the websocket receive loop
+        queue.get_nowait()
+        state.dropped_events += 1
+        queue.put_nowait(item)
 
 
-async def analyze_player_data():
-    """Analyze current player data against rubric using the ai_client.analyze_prompt wrapper."""
-    global latest_assessment_results
+def _write_events(batch):
+    global _unsynced_events
+    if not state.session_id:
+        return
+    for timestamp, event_type, data in batch:
+        # orjson writes datetimes as RFC 3339 natively, so no isoformat() per event
+        event = {'timestamp': timestamp, 'event_type': event_type, 'data': data}
+        if state.session_fp is not None:
+            _append_to_log(event)
+    state.session_event_count += len(batch)
+    if state.session_fp is not None:
+        state.unsaved_events += len(batch)
+    current_time = time.time()
+    if (current_time - (state.last_save_time or 0) > 5) or (state.unsaved_events >= 50):
+        save_session_realtime()
+        logger.debug("💾 Auto-saved session with %d events", state.session_event_count)
+    _unsynced_events += len(batch)
+    if _unsynced_events >= SYNC_BATCH or current_time - _last_sync_time > SYNC_INTERVAL:
+        _sync_session_log()
+
+
+def _drain_event_queue():
+    batch = []
+    queue = state.event_queue
+    while queue is not None and not queue.empty():
+        batch.append(queue.get_nowait())
+    return batch
+
+
+async def flush_events():
+    """Write any events still waiting in the queue and wait for batches already handed to the writer thread."""
+    await _run_io(_write_events, _drain_event_queue())
+
+
+def flush_events_blocking():
+    """Blocking flush_events for final shutdown and tests."""
+    _run_io_blocking(_write_events, _drain_event_queue())
+
+
+async def event_writer():
+    """Drain queued events in batches so serialization and file I/O never run per event."""
+    loop = asyncio.get_running_loop()
+    queue = state.get_event_queue()
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < EVENT_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        try:
+            # Shielded so shutdown cancellation cannot drop a batch still waiting for the thread
+            await asyncio.shield(loop.run_in_executor(_io_pool, _write_events, batch))
+        except Exception:
+            logger.exception('failed to write session events')
+
+
+# Below this many points the NumPy array setup costs more than the Python loop saves
+NUMPY_PATH_MIN_POINTS = 32
+# Above this many points the fused Numba loop avoids NumPy's (N,3) temporaries
+NUMBA_PATH_MIN_POINTS = 10_000
+
+if NUMBA_AVAILABLE:
+    @numba.njit(cache=True, fastmath=True)
+    def _path_length_nb(xs, ys, zs):
+        total = 0.0
+        for i in range(1, xs.shape[0]):
+            dx = xs[i] - xs[i - 1]
+            dy = ys[i] - ys[i - 1]
+            dz = zs[i] - zs[i - 1]
+            total += (dx * dx + dy * dy + dz * dz) ** 0.5
+        return total
+
+    # Compile at import so the first analysis request doesn't pay for it
+    _warm = np.zeros(4, dtype=np.float64)
+    _path_length_nb(_warm, _warm, _warm)
+    del _warm
+
+
+def _path_length_py(positions):
+    total_distance = 0
+    for i in range(1, len(positions)):
+        prev = positions[i-1]
+        curr = positions[i]
+        try:
+            distance = ((curr['x'] - prev['x'])**2 + (curr['y'] - prev['y'])**2 + (curr['z'] - prev['z'])**2) ** 0.5
+        except Exception:
+            distance = 0
+        total_distance += distance
+    return total_distance
+
+
+def _path_length(positions):
+    """Total distance along a list of {x, y, z} positions."""
+    n = len(positions)
+    if n <= NUMPY_PATH_MIN_POINTS:
+        return _path_length_py(positions)
     try:
-        rubric_path = os.path.join(os.path.dirname(__file__), '..', 'rubric.md')
-        if not os.path.exists(rubric_path):
-            return {'error': 'Rubric file not found'}
+        pts = np.fromiter((v for p in positions for v in (p['x'], p['y'], p['z'])), dtype=np.float64, count=3 * n).reshape(-1, 3)
+    except (KeyError, TypeError, ValueError):
+        # Malformed points are skipped pairwise by the Python loop
+        return _path_length_py(positions)
+    if NUMBA_AVAILABLE and n > NUMBA_PATH_MIN_POINTS:
+        return float(_path_length_nb(pts[:, 0], pts[:, 1], pts[:, 2]))
+    return float(np.linalg.norm(np.diff(pts, axis=0), axis=1).sum())
 
-        with open(rubric_path, 'r', encoding='utf-8') as f:
-            rubric_content = f.read()
-
-        # Aggregate events by player
-        player_analysis_data = {}
-        for event in state.session_events:
-            if event['event_type'] in ['player_position', 'block_placed', 'block_broken', 'player_join', 'player_leave', 'player_chat']:
-                pdata = event.get('data', {})
-                player_id = pdata.get('player_id') or pdata.get('player_name')
-                player_name = pdata.get('player_name', player_id)
-                if player_name not in player_analysis_data:
-                    player_analysis_data[player_name] = {'positions': [], 'blocks_placed': [], 'blocks_broken': [], 'join_time': None, 'leave_time': None, 'total_distance': 0}
-
-                entry = player_analysis_data[player_name]
-                etype = event['event_type']
-                if etype == 'player_position':
-                    pos = pdata.get('position')
-                    if pos:
-                        entry['positions'].append(pos)
-                elif etype == 'block_placed':
-                    entry['blocks_placed'].append({'type': pdata.get('block_type'), 'position': pdata.get('estimated_block_position'), 'time': event.get('timestamp')})
-                elif etype == 'block_broken':
-                    entry['blocks_broken'].append({'type': pdata.get('block_type'), 'position': pdata.get('estimated_block_position'), 'time': event.get('timestamp')})
-                elif etype == 'player_join':
-                    entry['join_time'] = event.get('timestamp')
-                elif etype == 'player_leave':
-                    entry['leave_time'] = event.get('timestamp')
 
-        # compute distances
-        for pname, pdata in player_analysis_data.items():
-            positions = pdata['positions']
-            if len(positions) > 1:
-                total_distance = 0
-                for i in range(1, len(positions)):
-                    prev = positions[i-1]
-                    curr = positions[i]
-                    try:
-                        distance = ((curr['x'] - prev['x'])**2 + (curr['y'] - prev['y'])**2 + (curr['z'] - prev['z'])**2) ** 0.5
-                    except Exception:
-                        distance = 0
-                    total_distance += distance
-                pdata['total_distance'] = round(total_distance, 2)
-
-        # Generate analysis per player using AI client
-        analyses = {}
-        for pname, pdata in player_analysis_data.items():
-            summary = f"Player Activity Summary:\n- Total positions recorded: {len(pdata['positions'])}\n- Total distance traveled: {pdata.get('total_distance', 0)} blocks\n- Blocks placed: {len(pdata['blocks_placed'])}\n- Blocks broken: {len(pdata['blocks_broken'])}\n- Session duration: {pdata['join_time']} to {pdata['leave_time'] or 'still active'}\n\nBlock Placement Details:\n"
-            for block in pdata['blocks_placed'][:10]:
-                pos = block.get('position') or {'x':0,'y':0,'z':0}
-                summary += f"- {block.get('type')} at ({pos.get('x')}, {pos.get('y')}, {pos.get('z')})\n"
-            if len(pdata['blocks_placed']) > 10:
-                summary += f"... and {len(pdata['blocks_placed']) - 10} more blocks\n"
-            summary += "\nBlock Breaking Details:\n"
-            for block in pdata['blocks_broken'][:10]:
-                pos = block.get('position') or {'x':0,'y':0,'z':0}
-                summary += f"- {block.get('type')} at ({pos.get('x')}, {pos.get('y')}, {pos.get('z')})\n"
-            if len(pdata['blocks_broken']) > 10:
-                summary += f"... and {len(pdata['blocks_broken']) - 10} more blocks\n"
-
-            prompt = f"""
-Please analyze the following Minecraft player's gameplay data against the provided rubric.
+# Players assessed per AI request; larger batches start to degrade answer quality
+PLAYER_BATCH_SIZE = 10
+_PLAYER_BLOCK_RE = re.compile(r'<player name="(.*?)">\s*(.*?)\s*</player>', re.DOTALL)
+
+
+def _player_summary(pdata):
+    summary = f"Player Activity Summary:\n- Total positions recorded: {len(pdata['positions'])}\n- Total distance traveled: {pdata.get('total_distance', 0)} blocks\n- Blocks placed: {len(pdata['blocks_placed'])}\n- Blocks broken: {len(pdata['blocks_broken'])}\n- Session duration: {pdata['join_time']} to {pdata['leave_time'] or 'still active'}\n\nBlock Placement Details:\n"
+    for block in pdata['blocks_placed'][:10]:
+        pos = block.get('position') or {'x':0,'y':0,'z':0}
+        summary += f"- {block.get('type')} at ({pos.get('x')}, {pos.get('y')}, {pos.get('z')})\n"
+    if len(pdata['blocks_placed']) > 10:
+        summary += f"... and {len(pdata['blocks_placed']) - 10} more blocks\n"
+    summary += "\nBlock Breaking Details:\n"
+    for block in pdata['blocks_broken'][:10]:
+        pos = block.get('position') or {'x':0,'y':0,'z':0}
+        summary += f"- {block.get('type')} at ({pos.get('x')}, {pos.get('y')}, {pos.get('z')})\n"
+    if len(pdata['blocks_broken']) > 10:
+        summary += f"... and {len(pdata['blocks_broken']) - 10} more blocks\n"
+    return summary
+
+
+async def _analyze_batch(rubric_content, batch):
+    """Assess a batch of (player name, summary) pairs in one AI call and split the reply per player."""
+    players = "\n\n".join(f"## PLAYER {i}: {pname}\n{summary}" for i, (pname, summary) in enumerate(batch, 1))
+    prompt = f"""
+Please analyze the following Minecraft players' gameplay data against the provided rubric.
 
 RUBRIC:
 {rubric_content}
 
-PLAYER: {pname}
+{players}
 
-{summary}
+Please provide a detailed assessment of each player's performance based on the rubric criteria. Include specific examples from their gameplay data and suggestions for improvement. Format each assessment in a clear, structured way with sections for different rubric criteria.
 
-Please provide a detailed assessment of this player's performance based on the rubric criteria. Include specific examples from their gameplay data and suggestions for improvement. Format the response in a clear, structured way with sections for different rubric criteria.
+Wrap each player's assessment in <player name="PLAYER NAME">...</player> tags, using the player names exactly as given above.
 """
+    try:
+        response = await analyze_prompt(prompt, max_tokens=1000 * len(batch))
+    except Exception as e:
+        return {pname: f"Error analyzing player: {e}" for pname, _ in batch}
+    if response is None or response.startswith('Error:'):
+        return {pname: response for pname, _ in batch}
+    parsed = dict(_PLAYER_BLOCK_RE.findall(response))
+    if len(batch) == 1 and batch[0][0] not in parsed:
+        return {batch[0][0]: response}
+    return {pname: parsed.get(pname, 'Error analyzing player: no assessment returned') for pname, _ in batch}
+
+
+def _add_position(entry, pdata, event):
+    pos = pdata.get('position')
+    if pos:
+        entry['positions'].append(pos)
+
+
+def _add_block_placed(entry, pdata, event):
+    entry['blocks_placed'].append({'type': pdata.get('block_type'), 'position': pdata.get('estimated_block_position'), 'time': event.get('timestamp')})
+
+
+def _add_block_broken(entry, pdata, event):
+    entry['blocks_broken'].append({'type': pdata.get('block_type'), 'position': pdata.get('estimated_block_position'), 'time': event.get('timestamp')})
 
-            try:
-                analysis_text = await analyze_prompt(prompt)
-            except Exception as e:
-                analysis_text = f"Error analyzing player: {e}"
 
-            analyses[pname] = analysis_text
+def _set_join_time(entry, pdata, event):
+    entry['join_time'] = event.get('timestamp')
+
+
+def _set_leave_time(entry, pdata, event):
+    entry['leave_time'] = event.get('timestamp')
+
+
+def _count_only(entry, pdata, event):
+    # Chat adds nothing to the summary, but still makes the player appear in the analysis
+    pass
+
+
+# event_type -> handler folding that event into the player's analysis entry
+_PLAYER_EVENT_HANDLERS = {
+    'player_position': _add_position,
+    'block_placed': _add_block_placed,
+    'block_broken': _add_block_broken,
+    'player_join': _set_join_time,
+    'player_leave': _set_leave_time,
+    'player_chat': _count_only,
+}
+
+
+def _iter_log_events(log_path):
+    """Yield events from an NDJSON session log one at a time."""
+    with open(log_path, 'rb') as log:
+        for line in log:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def _aggregate_player_data(log_path):
+    """Stream a session's NDJSON log and group the events analysis needs by player name."""
+    player_analysis_data = {}
+    if not log_path or not os.path.exists(log_path):
+        return player_analysis_data
+    handlers = _PLAYER_EVENT_HANDLERS
+    for event in _iter_log_events(log_path):
+        handler = handlers.get(event['event_type'])
+        if handler is None:
+            continue
+        pdata = event.get('data') or {}
+        player_name = pdata.get('player_name') or pdata.get('player_id')
+        entry = player_analysis_data.get(player_name)
+        if entry is None:
+            entry = player_analysis_data[player_name] = {'positions': [], 'blocks_placed': [], 'blocks_broken': [], 'join_time': None, 'leave_time': None, 'total_distance': 0}
+        handler(entry, pdata, event)
+    return player_analysis_data
+
+
+def _aggregate_current_session():
+    # Writer thread only: push buffered lines to the file before reading it back
+    save_session_realtime()
+    return _aggregate_player_data(state.session_log_file)
+
+
+async def analyze_player_data():
+    """Analyze current player data against rubric using the ai_client.analyze_prompt wrapper."""
+    global latest_assessment_results
+    await flush_events()
+    try:
+        try:
+            rubric_content = get_rubric()
+        except FileNotFoundError:
+            return {'error': 'Rubric file not found'}
+
+        # Events are only kept on disk, so aggregate by streaming the log on the writer thread
+        player_analysis_data = await asyncio.get_running_loop().run_in_executor(_io_pool, _aggregate_current_session)
+
+        # compute distances
+        for pname, pdata in player_analysis_data.items():
+            positions = pdata['positions']
+            if len(positions) > 1:
+                pdata['total_distance'] = round(_path_length(positions), 2)
+
+        # Generate analyses with one AI call per batch of players so the rubric is sent once per batch
+        summaries = [(pname, _player_summary(pdata)) for pname, pdata in player_analysis_data.items()]
+        batches = [summaries[i:i + PLAYER_BATCH_SIZE] for i in range(0, len(summaries), PLAYER_BATCH_SIZE)]
+        analyses = {}
+        for result in await asyncio.gather(*(_analyze_batch(rubric_content, batch) for batch in batches)):
+            analyses.update(result)
 
         state.latest_assessment_results = {'analyses': analyses}
         return {'analyses': analyses}
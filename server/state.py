@@ -1,27 +1,119 @@
 """Shared runtime state for the server."""
 from datetime import datetime, timezone
+import asyncio
 import os
+import numpy as np
 
 DATA_DIR = os.getenv('DATA_DIR', 'data')
 
+
+
+class PlayerPositions:
+    """Live player positions stored as parallel coordinate arrays indexed by a per-player slot.
+
+    Updates are three array stores instead of a new tuple or dict per move, and snapshot()
+    serializes every player at once for the periodic position broadcast.
+    """
+
+    def __init__(self, capacity=64):
+        self.xs = np.zeros(capacity, dtype=np.float64)
+        self.ys = np.zeros(capacity, dtype=np.float64)
+        self.zs = np.zeros(capacity, dtype=np.float64)
+        self.names = [None] * capacity
+        self.slots = {}  # player_id -> slot
+        self.free = list(range(capacity - 1, -1, -1))
+        self.dirty = set()  # players moved since the last position broadcast
+
+    def _grow(self):
+        old = len(self.names)
+        for attr in ('xs', 'ys', 'zs'):
+            setattr(self, attr, np.concatenate([getattr(self, attr), np.zeros(old, dtype=np.float64)]))
+        self.names.extend([None] * old)
+        self.free.extend(range(2 * old - 1, old - 1, -1))
+
+    def set_position(self, player_id, name, x, y, z):
+        slot = self.slots.get(player_id)
+        if slot is None:
+            if not self.free:
+                self._grow()
+            slot = self.slots[player_id] = self.free.pop()
+        self.names[slot] = name
+        self.xs[slot] = x
+        self.ys[slot] = y
+        self.zs[slot] = z
+        self.dirty.add(player_id)
+
+    def get(self, player_id):
+        """Return (name, x, y, z) for a player, or None if no position is known."""
+        slot = self.slots.get(player_id)
+        if slot is None:
+            return None
+        return self.names[slot], float(self.xs[slot]), float(self.ys[slot]), float(self.zs[slot])
+
+    def pop(self, player_id, default=None):
+        slot = self.slots.pop(player_id, None)
+        if slot is None:
+            return default
+        self.free.append(slot)
+        self.names[slot] = None
+        self.dirty.discard(player_id)
+        return slot
+
+    def items(self):
+        for player_id in list(self.slots):
+            yield player_id, self.get(player_id)
+
+    def snapshot(self, player_ids=None):
+        """Positions (all, or just player_ids) as web 'position' payloads, converted from the arrays in one pass."""
+        ids = [pid for pid in player_ids if pid in self.slots] if player_ids is not None else list(self.slots)
+        idx = [self.slots[pid] for pid in ids]
+        xs, ys, zs = self.xs[idx].tolist(), self.ys[idx].tolist(), self.zs[idx].tolist()
+        return [{'playerId': pid, 'playerName': self.names[i], 'x': x, 'y': y, 'z': z}
+                for pid, i, x, y, z in zip(ids, idx, xs, ys, zs)]
+
+    def __contains__(self, player_id):
+        return player_id in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+
 # Runtime collections
-player_positions = {}
+player_positions = PlayerPositions()
 web_clients = set()
+msgpack_clients = set()  # web clients that negotiated the binary msgpack codec
+web_outboxes = {}  # web client -> WebOutbox feeding its writer task
 minecraft_connections = set()
 block_events = []
 active_players = set()
-session_events = []
 latest_assessment_results = {}
 
 # Session tracking
 session_start_time = None
 session_id = None
 session_file = None
+session_log_file = None  # append-only NDJSON event log behind session_file
+session_fp = None
+session_event_count = 0  # events are kept only in the log, not in memory
 
-# Event buffer
-event_buffer = []
+# Events written to the session log since it was last flushed; the log itself holds the events
+unsaved_events = 0
 last_save_time = None
 
+# Events waiting for the session writer task; oldest entries are dropped when full
+EVENT_QUEUE_SIZE = 10000
+# Created on first use from inside the running loop: before Python 3.10 an asyncio.Queue binds
+# to the loop current at construction, which at import time is not the one asyncio.run starts
+event_queue = None
+dropped_events = 0
+
+
+def get_event_queue():
+    global event_queue
+    if event_queue is None:
+        event_queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+    return event_queue
+
 
 def ensure_data_directory():
     if not os.path.exists(DATA_DIR):
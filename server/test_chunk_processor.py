@@ -0,0 +1,134 @@
+import sys, os
+# Ensure repo root is on sys.path so the `server` package can be imported when running this script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from server.chunk_processor import ChunkProcessor, PackedChunk, RegionFile, _region_slot, _REGION_HEADER_BYTES
+
+
+def _chunk_with_palette(ids, size=16):
+    """A chunk using exactly the given block ids, in a repeating pattern"""
+    ids = np.asarray(ids, dtype=np.uint8)
+    return ids[np.arange(size ** 3) % len(ids)].reshape((size,) * 3)
+
+
+class TestPackedChunk(unittest.TestCase):
+    def test_round_trip_at_each_bit_width(self):
+        for bits, ids in ((0, [7]), (1, [0, 1]), (2, [0, 1, 3, 56]), (4, range(0, 160, 10)), (8, range(200))):
+            chunk = _chunk_with_palette(list(ids))
+            packed = PackedChunk(chunk)
+            self.assertEqual(packed.bits, bits)
+            self.assertEqual(packed.nbytes, len(ids) + chunk.size * bits // 8)
+            unpacked = packed.unpack()
+            self.assertEqual(unpacked.dtype, np.uint8)
+            self.assertEqual(unpacked.shape, chunk.shape)
+            self.assertTrue(np.array_equal(unpacked, chunk))
+            self.assertFalse(unpacked.flags.writeable)
+
+    def test_palette_size_picks_smallest_width(self):
+        self.assertEqual(PackedChunk(_chunk_with_palette([0, 1, 2])).bits, 2)
+        self.assertEqual(PackedChunk(_chunk_with_palette(range(5))).bits, 4)
+        self.assertEqual(PackedChunk(_chunk_with_palette(range(17))).bits, 8)
+
+    def test_generated_chunk_round_trip(self):
+        rng = np.random.default_rng(0)
+        chunk = rng.choice(np.array([0, 1, 2, 3, 16], dtype=np.uint8), size=(16, 16, 16))
+        self.assertTrue(np.array_equal(PackedChunk(chunk).unpack(), chunk))
+
+
+class TestRegionFile(unittest.TestCase):
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp()) / 'r.0.0.0.bin'
+
+    def test_region_slot(self):
+        self.assertEqual(_region_slot((0, 4, 0)), ((0, 4, 0), 0))
+        self.assertEqual(_region_slot((1, 0, 2)), ((0, 0, 0), 34))
+        self.assertEqual(_region_slot((31, -1, 31)), ((0, -1, 0), 1023))
+        self.assertEqual(_region_slot((32, 0, 0)), ((1, 0, 0), 0))
+        # Negative coordinates floor into the region below
+        self.assertEqual(_region_slot((-1, 0, -33)), ((-1, 0, -2), (31 << 5) | 31))
+
+    def test_append_and_read(self):
+        region = RegionFile(self.path, (0, 0, 0))
+        self.assertIsNone(region.read(5))
+        region.append([(5, b'five'), (1023, b'last')])
+        self.assertEqual(self.path.stat().st_size, _REGION_HEADER_BYTES + 8)
+        self.assertEqual(bytes(region.read(5)), b'five')
+        self.assertEqual(bytes(region.read(1023)), b'last')
+        self.assertEqual(sorted(region.chunk_keys()), [(0, 0, 5), (31, 0, 31)])
+
+    def test_rewrite_points_slot_at_new_record(self):
+        region = RegionFile(self.path, (0, 0, 0))
+        region.append([(5, b'old')])
+        self.assertEqual(bytes(region.read(5)), b'old')
+        # Appended after the file was mapped, so the read has to remap it
+        region.append([(5, b'newer'), (6, b'six')])
+        self.assertEqual(bytes(region.read(5)), b'newer')
+        self.assertEqual(bytes(region.read(6)), b'six')
+        self.assertEqual(len(region.chunk_keys()), 2)
+
+    def test_reopen_reads_header_from_disk(self):
+        region = RegionFile(self.path, (1, 2, -1))
+        region.append([(0, b'a'), (33, b'bc')])
+        region.append([(0, b'def')])
+        reopened = RegionFile(self.path, (1, 2, -1))
+        self.assertEqual(bytes(reopened.read(0)), b'def')
+        self.assertEqual(bytes(reopened.read(33)), b'bc')
+        self.assertEqual(sorted(reopened.chunk_keys()), [(32, 2, -32), (33, 2, -31)])
+
+
+class TestWriteFailures(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        # ChunkProcessor keeps its worlds/ directory under the working directory
+        os.chdir(tempfile.mkdtemp())
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+
+    def _stop_with_failing_writes(self, failures):
+        """Cache eight chunks, with a cache small enough that some are already being written, then stop
+        while the first `failures` writes raise; returns the processor and any loop callback errors"""
+        async def run():
+            errors = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+            processor = ChunkProcessor(max_workers=2, world_name='failing')
+            save = processor._save_chunks_to_disk
+            calls = []
+
+            def flaky_save(items):
+                calls.append(len(items))
+                if len(calls) <= failures:
+                    raise OSError('disk full')
+                save(items)
+
+            processor._save_chunks_to_disk = flaky_save
+            processor.max_memory_bytes = 4 * PackedChunk(_chunk_with_palette(range(5))).nbytes
+            for i in range(8):
+                processor._cache_chunk((i, 0, 0), _chunk_with_palette(range(i % 3, i % 3 + 5)))
+            await processor.stop()
+            return processor, errors
+
+        return asyncio.run(run())
+
+    def test_stop_retries_failed_writes(self):
+        processor, errors = self._stop_with_failing_writes(failures=2)
+        self.assertEqual(errors, [])
+        self.assertEqual(processor.chunks_on_disk, {(i, 0, 0) for i in range(8)})
+        region = RegionFile(processor.world_path / 'r.0.0.0.bin', (0, 0, 0))
+        self.assertEqual(sorted(region.chunk_keys()), [(i, 0, 0) for i in range(8)])
+
+    def test_stop_gives_up_and_logs_lost_chunks(self):
+        with self.assertLogs('server.chunk_processor', 'ERROR') as logs:
+            processor, errors = self._stop_with_failing_writes(failures=1000)
+        self.assertEqual(errors, [])
+        self.assertEqual(processor.chunks_on_disk, set())
+        self.assertTrue(any('Lost 8 chunks' in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import sys, os
+# Ensure repo root is on sys.path so the `server` package can be imported when running this script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import asyncio
+import pickle
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+import numpy as np
+from server import chunk_storage
+from server.chunk_storage import ChunkStorage, META_RECORD
+
+
+def _chunk(value):
+    return np.full(chunk_storage.CHUNK_SHAPE, value, dtype=np.uint8)
+
+
+class TestChunkStorage(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def test_save_and_reopen(self):
+        async def run():
+            storage = ChunkStorage(self.data_dir)
+            for i in range(25):
+                await storage.save(i, -i, 3, _chunk(i))
+            await storage.save_metadata()
+            return storage
+
+        storage = asyncio.run(run())
+        self.assertEqual(storage.metadata_log.stat().st_size, 25 * META_RECORD.size)
+        self.assertFalse(storage.metadata_file.exists())
+
+        reopened = ChunkStorage(self.data_dir)
+        self.assertEqual(len(reopened.chunk_index), 25)
+        self.assertEqual(reopened.next_slot, 25)
+        self.assertEqual(reopened.chunk_index[(24, -24, 3)]['blocks'], 4096)
+        loaded = asyncio.run(reopened.load(7, -7, 3))
+        self.assertTrue(np.array_equal(loaded, _chunk(7)))
+
+    def test_resave_reuses_slot(self):
+        async def run():
+            storage = ChunkStorage(self.data_dir)
+            await storage.save(1, 2, 3, _chunk(1))
+            await storage.save(1, 2, 3, _chunk(2))
+            await storage.save_metadata()
+
+        asyncio.run(run())
+        reopened = ChunkStorage(self.data_dir)
+        self.assertEqual(reopened.next_slot, 1)
+        self.assertTrue(np.array_equal(asyncio.run(reopened.load(1, 2, 3)), _chunk(2)))
+
+    def test_snapshot_then_log_replay(self):
+        async def run():
+            storage = ChunkStorage(self.data_dir)
+            for i in range(12):
+                await storage.save(i, 0, 0, _chunk(1))
+            await storage.save_metadata()
+            # Written after the snapshot, so they only exist in the log
+            for i in range(12, 15):
+                await storage.save(i, 0, 0, _chunk(2))
+            await storage.save_metadata()
+            return storage
+
+        with mock.patch.object(chunk_storage, 'SNAPSHOT_EVERY', 12):
+            storage = asyncio.run(run())
+        self.assertTrue(storage.metadata_file.exists())
+        self.assertEqual(storage.metadata_log.stat().st_size, 3 * META_RECORD.size)
+
+        reopened = ChunkStorage(self.data_dir)
+        self.assertEqual(len(reopened.chunk_index), 15)
+        self.assertEqual(reopened.chunk_index[(14, 0, 0)]['slot'], 14)
+        self.assertTrue(np.array_equal(asyncio.run(reopened.load(13, 0, 0)), _chunk(2)))
+
+    def test_torn_log_tail_is_dropped(self):
+        async def run():
+            storage = ChunkStorage(self.data_dir)
+            for i in range(10):
+                await storage.save(i, 0, 0, _chunk(1))
+            return storage
+
+        storage = asyncio.run(run())
+        with open(storage.metadata_log, 'ab') as f:
+            f.write(b'torn')
+        reopened = ChunkStorage(self.data_dir)
+        self.assertEqual(len(reopened.chunk_index), 10)
+        self.assertEqual(reopened.metadata_log.stat().st_size, 10 * META_RECORD.size)
+
+
+class TestLegacyChunks(unittest.TestCase):
+    def setUp(self):
+        self.storage = ChunkStorage(tempfile.mkdtemp())
+
+    def _write_legacy(self, key, payload):
+        path = self.storage._get_chunk_path(*key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(zlib.compress(payload))
+        self.storage.chunk_index[key] = {'timestamp': '2024-01-01T00:00:00', 'blocks': 1}
+
+    def test_pickled_chunk_loads(self):
+        chunk = np.arange(4096, dtype=np.uint8).reshape(chunk_storage.CHUNK_SHAPE)
+        for protocol in (2, pickle.HIGHEST_PROTOCOL):
+            key = (protocol, 0, -40)
+            self._write_legacy(key, pickle.dumps(chunk, protocol=protocol))
+            loaded = asyncio.run(self.storage.load(*key))
+            self.assertTrue(np.array_equal(loaded, chunk))
+
+    def test_other_globals_are_refused(self):
+        self._write_legacy((0, 0, 0), pickle.dumps(os.getcwd))
+        with self.assertLogs(chunk_storage.logger, 'ERROR'):
+            self.assertIsNone(asyncio.run(self.storage.load(0, 0, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import sys, os
+# Ensure repo root is on sys.path so the `server` package can be imported when running this script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import unittest
+from server.minecraft_ws import _block_key
+
+
+class TestBlockKey(unittest.TestCase):
+    def test_same_block_same_key(self):
+        self.assertEqual(_block_key(3.1, 64.0, -7.2), _block_key(3.9, 64.7, -7.9))
+
+    def test_crossing_zero_changes_block(self):
+        # Truncating would put -0.5 and 0.5 in the same block, making the strip at 0 two blocks wide
+        self.assertNotEqual(_block_key(-0.5, 64.0, 5.5), _block_key(0.5, 64.0, 5.5))
+        self.assertNotEqual(_block_key(5.5, 64.0, -0.5), _block_key(5.5, 64.0, 0.5))
+        self.assertNotEqual(_block_key(-1.5, 64.0, 5.5), _block_key(-0.5, 64.0, 5.5))
+
+    def test_negative_block_matches_floor(self):
+        self.assertEqual(_block_key(-0.1, 64.0, -0.1), _block_key(-1.0, 64.0, -1.0))
+        self.assertNotEqual(_block_key(-0.1, -0.1, -0.1), _block_key(-0.1, 0.1, -0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import sys, os
+# Ensure repo root is on sys.path so the `server` package can be imported when running this script directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import asyncio
+import json
+import tempfile
+import unittest
+from server import session, state
+
+
+class TestSessionLog(unittest.TestCase):
+    def setUp(self):
+        self._data_dir = state.DATA_DIR
+        state.DATA_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        state.session_id = None
+        state.DATA_DIR = self._data_dir
+
+    def test_events_round_trip_through_ndjson(self):
+        asyncio.run(session.start_session())
+        now = state.now_utc()
+        session._run_io_blocking(session._write_events, [
+            (now, 'player_join', session.PlayerEvent('1', 'Alex')),
+            (now, 'player_position', session.PlayerEvent('1', 'Alex', 0.0, 64.0, 0.0)),
+            (now, 'player_position', session.PlayerEvent('1', 'Alex', 3.0, 64.0, 4.0)),
+            (now, 'block_placed', session.PlayerEvent('1', 'Alex', 3.0, 64.0, 4.0, extra={'block_type': 'minecraft:dirt', 'estimated_block_position': {'x': 3, 'y': 65, 'z': 4}}, position_field='player_position')),
+        ])
+        players = session._run_io_blocking(session._aggregate_current_session)
+        self.assertEqual(len(players['Alex']['positions']), 2)
+        self.assertEqual(session._path_length(players['Alex']['positions']), 5.0)
+        self.assertEqual(players['Alex']['blocks_placed'][0]['type'], 'minecraft:dirt')
+
+        session.end_session_blocking()
+        with open(state.session_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        self.assertEqual(saved['session_info']['total_events'], 6)
+        self.assertEqual([e['event_type'] for e in saved['events']][0], 'session_start')
+        self.assertEqual(saved['events'][-1]['event_type'], 'session_end')
+        self.assertEqual(saved['events'][2]['data']['position'], {'x': 0.0, 'y': 64.0, 'z': 0.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
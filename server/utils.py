@@ -1,38 +1,188 @@
 """Utility helpers shared across modules."""
-import json
+import asyncio
+import itertools
 import logging
+import os
+import socket
+import time
+import orjson
+from collections import deque
+from websockets.exceptions import ConnectionClosed
+from uuid import uuid4
 from .state import *
 
 logger = logging.getLogger(__name__)
 
+# Request ids only need to be unique per server run: one random UUID prefix plus a counter
+# keeps the UUID shape Minecraft expects without touching the OS entropy pool per command
+_request_id_prefix = str(uuid4())[:23]
+_request_counter = itertools.count()
+
+
+def next_request_id():
+    return f"{_request_id_prefix}-{next(_request_counter):012x}"
+
+
+# msgpack is optional; without it every web client stays on JSON text frames
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+
+# orjson options for every JSON frame sent to the browser
+WEB_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def encode_for_web(client, message):
+    """Serialize a message in the codec negotiated by the given web client."""
+    if client in msgpack_clients:
+        return msgpack.packb(message, use_bin_type=True)
+    return orjson.dumps(message, option=WEB_JSON_OPTIONS)
+
+
+async def send_to_web(client, message):
+    await client.send(encode_for_web(client, message), text=client not in msgpack_clients)
+
+
+# Broadcast frames buffered per web client; the oldest are dropped when a client falls behind
+WEB_SEND_QUEUE_SIZE = 256
+
+
+class WebOutbox:
+    """Bounded send queue drained by one writer task per web client."""
+    __slots__ = ('queue', 'wakeup', 'task')
+
+    def __init__(self):
+        self.queue = deque(maxlen=WEB_SEND_QUEUE_SIZE)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+
+async def _web_writer(client, outbox):
+    try:
+        while True:
+            await outbox.wakeup.wait()
+            outbox.wakeup.clear()
+            while outbox.queue:
+                frame, is_text = outbox.queue.popleft()
+                # JSON frames are pre-encoded UTF-8; text=True sends them as text without re-encoding
+                await client.send(frame, text=is_text)
+    except ConnectionClosed:
+        pass
+    except Exception:
+        logger.exception('web client writer failed')
+    finally:
+        unregister_web_client(client)
+
+
+def register_web_client(client):
+    """Track a web client and start the writer task that delivers its broadcasts."""
+    outbox = WebOutbox()
+    web_clients.add(client)
+    web_outboxes[client] = outbox
+    outbox.task = asyncio.create_task(_web_writer(client, outbox))
+
+
+def unregister_web_client(client):
+    web_clients.discard(client)
+    msgpack_clients.discard(client)
+    outbox = web_outboxes.pop(client, None)
+    if outbox is not None and outbox.task is not asyncio.current_task():
+        outbox.task.cancel()
+
 
 async def broadcast_to_web(message):
-    disconnected = set()
-    for client in list(web_clients):
-        try:
-            await client.send(json.dumps(message))
-        except Exception:
-            disconnected.add(client)
-    web_clients.difference_update(disconnected)
+    """Queue a message for every web client, encoding it once per codec; never waits on a slow client."""
+    text = packed = None
+    for client, outbox in list(web_outboxes.items()):
+        if client in msgpack_clients:
+            if packed is None:
+                packed = (msgpack.packb(message, use_bin_type=True), False)
+            outbox.queue.append(packed)
+        else:
+            if text is None:
+                text = (orjson.dumps(message, option=WEB_JSON_OPTIONS), True)
+            outbox.queue.append(text)
+        outbox.wakeup.set()
 
 
 async def send_message_to_minecraft(websocket, message):
-    from uuid import uuid4
     formatted_message = f"§e§l[Server]§r §f{message}"
-    command = {"header": {"version": 1, "requestId": str(uuid4()), "messageType": "commandRequest", "messagePurpose": "commandRequest"}, "body": {"origin": {"type": "player"}, "commandLine": f'tellraw @a {{"rawtext":[{{"text":"{formatted_message}"}}]}}', "version": 1}}
-    await websocket.send(json.dumps(command))
+    command = {"header": {"version": 1, "requestId": next_request_id(), "messageType": "commandRequest", "messagePurpose": "commandRequest"}, "body": {"origin": {"type": "player"}, "commandLine": f'tellraw @a {{"rawtext":[{{"text":"{formatted_message}"}}]}}', "version": 1}}
+    await websocket.send(orjson.dumps(command), text=True)
     logger.info(f"📢 Sent message to players: {message}")
 
 
 async def send_command_to_minecraft(websocket, command, target_players=None, is_player_specific=False):
-    from uuid import uuid4
     if is_player_specific and target_players:
         for player_name in target_players:
             player_command = command.replace('@t', f'@a[name={player_name}]')
-            cmd = {"header": {"version": 1, "requestId": str(uuid4()), "messageType": "commandRequest", "messagePurpose": "commandRequest"}, "body": {"origin": {"type": "player"}, "commandLine": player_command, "version": 1}}
-            await websocket.send(json.dumps(cmd))
+            cmd = {"header": {"version": 1, "requestId": next_request_id(), "messageType": "commandRequest", "messagePurpose": "commandRequest"}, "body": {"origin": {"type": "player"}, "commandLine": player_command, "version": 1}}
+            await websocket.send(orjson.dumps(cmd), text=True)
             logging.info(f"🎮 Sent command for {player_name}: {player_command}")
     else:
-        cmd = {"header": {"version": 1, "requestId": str(uuid4()), "messageType": "commandRequest", "messagePurpose": "commandRequest"}, "body": {"origin": {"type": "player"}, "commandLine": command, "version": 1}}
-        await websocket.send(json.dumps(cmd))
+        cmd = {"header": {"version": 1, "requestId": next_request_id(), "messageType": "commandRequest", "messagePurpose": "commandRequest"}, "body": {"origin": {"type": "player"}, "commandLine": command, "version": 1}}
+        await websocket.send(orjson.dumps(cmd), text=True)
         logging.info(f"🎮 Sent command: {command}")
+
+
+EXTERNAL_IP_TTL = 60.0
+_ip_cache = {'ts': 0.0, 'ip': None}
+
+
+def get_external_ip():
+    """Address to show players: EXTERNAL_IP/SERVER_HOST if set, else the outbound interface IP cached for a minute."""
+    env_ip = os.getenv('EXTERNAL_IP') or os.getenv('SERVER_HOST')
+    if env_ip:
+        return env_ip
+    now = time.monotonic()
+    if _ip_cache['ip'] is not None and now - _ip_cache['ts'] < EXTERNAL_IP_TTL:
+        return _ip_cache['ip']
+    try:
+        # Use UDP trick to determine outbound IP on machines with network access
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            ip = s.getsockname()[0]
+    except Exception:
+        ip = 'localhost'
+    _ip_cache.update(ts=now, ip=ip)
+    return ip
+
+
+RUBRIC_PATH = os.path.join(os.path.dirname(__file__), '..', 'rubric.md')
+# Rubric text and its pre-encoded /api/rubric body, refreshed only when the file's mtime changes
+_rubric_cache = {'mtime': None, 'content': None, 'json_bytes': None}
+
+
+def get_rubric():
+    """Return the rubric text, re-reading the file only after it changes. Raises FileNotFoundError."""
+    mtime = os.stat(RUBRIC_PATH).st_mtime_ns
+    if mtime != _rubric_cache['mtime']:
+        with open(RUBRIC_PATH, 'r', encoding='utf-8') as f:
+            content = f.read()
+        _rubric_cache.update(mtime=mtime, content=content, json_bytes=None)
+    return _rubric_cache['content']
+
+
+def get_rubric_json():
+    """Return the rubric wrapped as {'content': ...} JSON bytes, encoded once per rubric version."""
+    get_rubric()
+    if _rubric_cache['json_bytes'] is None:
+        _rubric_cache['json_bytes'] = orjson.dumps({'content': _rubric_cache['content']})
+    return _rubric_cache['json_bytes']
+
+
+def save_rubric(content):
+    """Write the rubric, keeping a .backup of the previous version, and refresh the cache."""
+    if os.path.exists(RUBRIC_PATH):
+        backup_path = RUBRIC_PATH + '.backup'
+        with open(RUBRIC_PATH, 'r', encoding='utf-8') as f:
+            backup_content = f.read()
+        with open(backup_path, 'w', encoding='utf-8') as f:
+            f.write(backup_content)
+    with open(RUBRIC_PATH, 'w', encoding='utf-8') as f:
+        f.write(content)
+    _rubric_cache.update(mtime=os.stat(RUBRIC_PATH).st_mtime_ns, content=content, json_bytes=None)
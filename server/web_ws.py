@@ -1,13 +1,13 @@
 """Web browser WebSocket handler moved from app.py"""
-import json
 import logging
+import orjson
 import time
 import os
 import websockets
 import asyncio
 from . import state
 from .session import analyze_player_data, record_event, start_session, end_session
-from .utils import broadcast_to_web, send_message_to_minecraft, send_command_to_minecraft
+from .utils import broadcast_to_web, send_to_web, register_web_client, unregister_web_client, send_message_to_minecraft, send_command_to_minecraft, MSGPACK_AVAILABLE, WEB_JSON_OPTIONS
 
 logger = logging.getLogger(__name__)
 
@@ -15,25 +15,25 @@ logger = logging.getLogger(__name__)
 async def handle_web_client(websocket):
     """Handle web client connections with full world streaming"""
     logger.info('Web client connected for live updates')
-    state.web_clients.add(websocket)
+    register_web_client(websocket)
     try:
         if state.session_id:
-            await websocket.send(json.dumps({'type':'session_info','sessionId': state.session_id,'startTime': state.session_start_time.isoformat() if state.session_start_time else None,'fileName': os.path.basename(state.session_file) if state.session_file else None}))
+            await websocket.send(orjson.dumps({'type':'session_info','sessionId': state.session_id,'startTime': state.session_start_time.isoformat() if state.session_start_time else None,'fileName': os.path.basename(state.session_file) if state.session_file else None}), text=True)
         # Send the authoritative active players list (ids, names, optional positions)
         try:
             players_list = []
             for pid in state.active_players:
-                pname = state.player_positions.get(pid, {}).get('name', pid)
-                entry = {'playerId': pid, 'playerName': pname}
                 pos = state.player_positions.get(pid)
                 if pos:
-                    entry.update({'x': pos['x'], 'y': pos['y'], 'z': pos['z']})
-                players_list.append(entry)
-            await websocket.send(json.dumps({'type': 'active_players', 'players': players_list}))
+                    pname, x, y, z = pos
+                    players_list.append({'playerId': pid, 'playerName': pname, 'x': x, 'y': y, 'z': z})
+                else:
+                    players_list.append({'playerId': pid, 'playerName': pid})
+            await websocket.send(orjson.dumps({'type': 'active_players', 'players': players_list}), text=True)
         except Exception:
             logger.exception('failed to send active players list to new web client')
-        for player_id, pos in state.player_positions.items():
-            await websocket.send(json.dumps({'type':'position','playerId': player_id,'playerName': pos.get('name', player_id),'x': pos['x'],'y': pos['y'],'z': pos['z']}))
+        if state.player_positions:
+            await send_to_web(websocket, {'type': 'positions', 'players': state.player_positions.snapshot()})
         
         # Send initial world data if renderer is available
         renderer = getattr(handle_web_client, 'renderer', None)
@@ -45,31 +45,38 @@ async def handle_web_client(websocket):
             
             # Send all currently loaded chunks
             initial_data = await renderer.get_all_loaded_chunks()
-            await websocket.send(json.dumps({
+            await websocket.send(orjson.dumps({
                 'type': 'world_data',
                 'data': initial_data
-            }))
+            }, option=WEB_JSON_OPTIONS), text=True)
         
         # Start streaming new chunks
         chunk_streamer = asyncio.create_task(stream_new_chunks(websocket, renderer)) if renderer else None
         
         async for message in websocket:
             try:
-                msg = json.loads(message)
-                if msg.get('type') == 'analyze_request':
+                msg = orjson.loads(message)
+                if msg.get('type') == 'hello':
+                    # Codec handshake: switch to binary msgpack frames when both sides support it
+                    if MSGPACK_AVAILABLE and 'msgpack' in (msg.get('codecs') or []):
+                        await websocket.send(orjson.dumps({'type': 'codec', 'codec': 'msgpack'}), text=True)
+                        state.msgpack_clients.add(websocket)
+                    else:
+                        await websocket.send(orjson.dumps({'type': 'codec', 'codec': 'json'}), text=True)
+                elif msg.get('type') == 'analyze_request':
                     logger.info('Received AI analysis request')
                     analysis_result = await analyze_player_data()
-                    await websocket.send(json.dumps({'type':'analysis_result', **analysis_result}))
+                    await send_to_web(websocket, {'type':'analysis_result', **analysis_result})
                 elif msg.get('type') == 'clear_session':
                     logger.info('Received clear session request')
                     if state.session_id and state.active_players:
-                        end_session()
+                        await end_session()
                     # Clear shared session state
-                    state.session_events = []
-                    state.event_buffer = []
+                    state.session_event_count = 0
+                    state.unsaved_events = 0
                     state.last_save_time = time.time()
                     if state.active_players:
-                        start_session()
+                        await start_session()
                         await broadcast_to_web({'type':'session_cleared','sessionId': state.session_id,'startTime': state.session_start_time.isoformat() if state.session_start_time else None,'fileName': os.path.basename(state.session_file) if state.session_file else None})
                     else:
                         await broadcast_to_web({'type':'session_cleared','sessionId': None,'startTime': None,'fileName': None})
@@ -97,9 +104,9 @@ async def handle_web_client(websocket):
                         selected_player_names = []
                         if target_mode == 'selected' and target_players:
                             for player_id in target_players:
-                                for pid, pos in state.player_positions.items():
-                                    if pid == player_id:
-                                        selected_player_names.append(pos.get('name', player_id))
+                                pos = state.player_positions.get(player_id)
+                                if pos:
+                                    selected_player_names.append(pos[0])
                         for mc_client in state.minecraft_connections:
                             try:
                                 if target_mode == 'all' or not is_player_specific:
@@ -117,7 +124,7 @@ async def handle_web_client(websocket):
     finally:
         if chunk_streamer:
             chunk_streamer.cancel()
-        state.web_clients.discard(websocket)
+        unregister_web_client(websocket)
         logger.info('Web client disconnected')
 
 
@@ -129,10 +136,10 @@ async def stream_new_chunks(websocket, renderer):
             new_chunks = await renderer.get_new_chunks(timeout=1.0)
             
             if new_chunks:
-                await websocket.send(json.dumps({
+                await send_to_web(websocket, {
                     'type': 'new_chunks',
                     'chunks': new_chunks
-                }))
+                })
             
             await asyncio.sleep(0.1)  # Small delay between checks
             
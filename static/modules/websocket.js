@@ -50,9 +50,15 @@ export async function connect(host = null, port = null, path = 'live') {
     const wsUrl = `ws://${host}:${port}/${path}`;
     console.log('Connecting to WebSocket:', wsUrl);
     ws = new WebSocket(wsUrl);
+    // Binary frames carry msgpack once the server acknowledges the codec handshake
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
         console.log('Connected to live updates');
+        // Offer msgpack only if the decoder script loaded; otherwise the server keeps sending JSON
+        if (window.MessagePack && typeof window.MessagePack.decode === 'function') {
+            send({ type: 'hello', codecs: ['msgpack'] });
+        }
         const wsStatus = document.getElementById('wsStatus');
         if (wsStatus) wsStatus.textContent = 'Connected';
         const status = document.getElementById('status');
@@ -65,12 +71,17 @@ export async function connect(host = null, port = null, path = 'live') {
     ws.onmessage = (event) => {
         let data;
         try {
-            data = JSON.parse(event.data);
+            data = (event.data instanceof ArrayBuffer)
+                ? window.MessagePack.decode(new Uint8Array(event.data))
+                : JSON.parse(event.data);
         } catch (e) {
-            console.error('Invalid WS JSON', e);
+            console.error('Invalid WS message', e);
             return;
         }
+        handleMessage(data);
+    };
 
+    function handleMessage(data) {
         console.log('Received:', data.type, data);
 
         switch (data.type) {
@@ -89,6 +100,10 @@ export async function connect(host = null, port = null, path = 'live') {
                 if (events && typeof events.triggerSessionUpdated === 'function') events.triggerSessionUpdated();
                 break;
 
+            case 'codec':
+                console.log('Web socket codec:', data.codec);
+                break;
+
             case 'save_notification':
                 try { if (events && typeof events.triggerSaveNotification === 'function') events.triggerSaveNotification(); } catch (e) { console.error(e); }
                 break;
@@ -120,6 +135,11 @@ export async function connect(host = null, port = null, path = 'live') {
                 }
                 break;
 
+            case 'positions':
+                // Server batches all moved players into one snapshot per tick
+                (data.players || []).forEach((p) => handleMessage({ type: 'position', ...p }));
+                break;
+
             case 'position':
                 try {
                     if (players && typeof players.updatePlayer === 'function') {
@@ -359,7 +379,7 @@ export async function connect(host = null, port = null, path = 'live') {
             default:
                 console.warn('Unhandled WS message type:', data.type);
         }
-    };
+    }
 
     ws.onclose = () => {
         console.log('Disconnected from live updates');